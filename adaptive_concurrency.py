@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Adaptive Concurrency
+AIMD controller that sizes the number of in-flight ISP requests from
+observed latency and 429/5xx rates
+"""
+
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Union
+
+# Outcomes that mean the ISP is shedding load and we must back off now
+OVERLOAD_OUTCOMES = {429, 503, 'timeout'}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class AIMDController:
+    """Additive-increase / multiplicative-decrease limit on requests in flight
+
+    Every window of completed requests the controller compares p95 latency
+    against a slowly adapting baseline. While latency and error rate stay
+    flat the limit grows by ``increase_step``; a latency spike, too many
+    errors or any 429/503/timeout cuts it by ``decrease_factor``. Overload
+    responses cut immediately, at most once per cooldown, so a burst of
+    429s from the same window only counts once.
+    """
+
+    def __init__(self, min_limit: int = 1, max_limit: int = 100, initial_limit: Optional[int] = None,
+                 increase_step: int = 2, decrease_factor: float = 0.5,
+                 latency_tolerance: float = 1.5, max_error_rate: float = 0.05,
+                 min_window: int = 20, history: int = 20):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.max_error_rate = max_error_rate
+        self.min_window = min_window
+
+        self._limit = initial_limit if initial_limit is not None else min(max_limit, 10)
+        self._in_flight = 0
+        self._waiters = deque()
+        self._latencies = []
+        self._errors = 0
+        self._baseline_p95 = None
+        self._last_p95 = None
+        self._last_decrease = 0.0
+        self._decisions = deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    async def acquire(self):
+        """Wait until a request slot is free under the current limit"""
+        while True:
+            with self._lock:
+                if self._in_flight < self._limit:
+                    self._in_flight += 1
+                    return
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            await waiter
+
+    def release(self, latency: float, outcome: Union[int, str]):
+        """Free a slot and record how the request went
+
+        ``outcome`` is the HTTP status code, or 'timeout' / 'connection'.
+        """
+        with self._lock:
+            self._in_flight -= 1
+            now = time.monotonic()
+
+            if outcome in OVERLOAD_OUTCOMES:
+                # Handled here rather than in the windowed error rate
+                cooldown = self._last_p95 or 1.0
+                if now - self._last_decrease >= cooldown:
+                    self._decrease(now, f"ISP overload ({outcome})")
+            else:
+                if not (isinstance(outcome, int) and outcome < 500):
+                    self._errors += 1
+                self._latencies.append(latency)
+
+            if len(self._latencies) + self._errors >= max(self.min_window, self._limit):
+                self._evaluate(now)
+
+        self._wake()
+
+    def abandon(self):
+        """Free a slot whose request was never sent, without recording an outcome"""
+        with self._lock:
+            self._in_flight -= 1
+        self._wake()
+
+    def _evaluate(self, now: float):
+        samples = len(self._latencies) + self._errors
+        error_rate = self._errors / samples
+        p95 = percentile(self._latencies, 95) if self._latencies else None
+        self._latencies = []
+        self._errors = 0
+
+        if p95 is not None:
+            self._last_p95 = p95
+            # Let the baseline creep up slowly so a permanently slower ISP
+            # does not read as a spike forever
+            if self._baseline_p95 is None:
+                self._baseline_p95 = p95
+            else:
+                self._baseline_p95 = min(p95, self._baseline_p95 * 1.02)
+
+        if error_rate > self.max_error_rate:
+            self._decrease(now, f"error rate {error_rate:.0%}")
+        elif p95 is not None and p95 > self._baseline_p95 * self.latency_tolerance:
+            self._decrease(now, f"p95 {p95 * 1000:.0f} ms vs baseline {self._baseline_p95 * 1000:.0f} ms")
+        elif self._limit < self.max_limit:
+            self._limit = min(self.max_limit, self._limit + self.increase_step)
+            self._record('increase', f"p95 {p95 * 1000:.0f} ms steady" if p95 is not None else "steady")
+
+    def _decrease(self, now: float, reason: str):
+        new_limit = max(self.min_limit, int(self._limit * self.decrease_factor))
+        self._last_decrease = now
+        self._latencies = []
+        self._errors = 0
+        if new_limit != self._limit:
+            self._limit = new_limit
+            self._record('decrease', reason)
+
+    def _record(self, action: str, reason: str):
+        self._decisions.appendleft({
+            'time': time.strftime('%H:%M:%S'),
+            'action': action,
+            'limit': self._limit,
+            'reason': reason,
+        })
+
+    def _wake(self):
+        # Hand free slots to as many waiters as can actually use them
+        free = self._limit - self._in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def snapshot(self) -> Dict:
+        """Current state for display, safe to call from any thread"""
+        with self._lock:
+            return {
+                'in_flight': self._in_flight,
+                'limit': self._limit,
+                'max_limit': self.max_limit,
+                'p95_ms': round(self._last_p95 * 1000) if self._last_p95 else None,
+                'baseline_p95_ms': round(self._baseline_p95 * 1000) if self._baseline_p95 else None,
+                'decisions': list(self._decisions),
+            }
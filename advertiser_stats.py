@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Advertiser Stats
+Vectorised advertiser aggregations: the top-N selection behind the
+result store's advertiser totals, and the per-main-term breakdown over
+its summary and long-format tables
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def top_n(counts: np.ndarray, n: int = 10) -> np.ndarray:
+    """Indexes of the ``n`` largest non-zero counts, largest first
+
+    Uses a partial selection, so only the top ``n`` are ever sorted.
+    """
+    present = np.flatnonzero(counts)
+    if len(present) > n:
+        present = present[np.argpartition(counts[present], -n)[-n:]]
+    return present[np.argsort(-counts[present], kind='stable')]
+
+
+def main_term_breakdown(summary_df: pd.DataFrame, detailed_df: pd.DataFrame) -> pd.DataFrame:
+    """Per main term: keywords, keywords with ads, total ads and distinct advertisers"""
+    keywords = summary_df.assign(has_ads=summary_df['ad_count'] > 0).groupby('main_term', observed=True).agg(
+        keywords=('ad_count', 'size'),
+        keywords_with_ads=('has_ads', 'sum'),
+        total_ads=('ad_count', 'sum'),
+    )
+    advertisers = detailed_df.groupby('main_term', observed=True)['advertiser'].nunique()
+    breakdown = keywords.join(advertisers.rename('distinct_advertisers'), how='left')
+    breakdown['distinct_advertisers'] = breakdown['distinct_advertisers'].fillna(0).astype(int)
+    return breakdown.sort_values('keywords', ascending=False).reset_index()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Advertiser Aggregation Benchmark
+Compares the old split-and-count loops over the summary table's
+comma-joined advertisers against the result store's running advertiser
+totals the app reads, on synthetic results
+"""
+
+import argparse
+import time
+
+import pandas as pd
+
+from advertiser_stats import main_term_breakdown
+from benchmark_excel import build_store
+from result_store import ResultStore
+
+
+def run_legacy(df: pd.DataFrame):
+    """The pre-vectorisation metric and chart code"""
+    unique = len(set(
+        advertiser for advertisers in df['advertisers']
+        if advertisers for advertiser in advertisers.split(',')
+    ))
+
+    advertiser_counts = {}
+    for advertisers in df['advertisers']:
+        if advertisers:
+            for advertiser in advertisers.split(','):
+                advertiser = advertiser.strip()
+                advertiser_counts[advertiser] = advertiser_counts.get(advertiser, 0) + 1
+    advertiser_df = pd.DataFrame(list(advertiser_counts.items()), columns=['Advertiser', 'Count'])
+    top = advertiser_df.sort_values('Count', ascending=False).head(10)
+    return unique, top
+
+
+def run_totals(results: ResultStore):
+    """What the app reads for the Unique Advertisers metric and the Top 10 chart"""
+    return results.distinct_advertisers, results.top_advertisers(10)
+
+
+def run_breakdown(results: ResultStore):
+    """The per-main-term breakdown, built once per finished job"""
+    return main_term_breakdown(results.summary_frame(), results.detailed_frame(results.completed_rows()))
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark advertiser aggregation")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--advertisers", type=int, default=5000)
+    parser.add_argument("--max-ads", type=int, default=10, help="Maximum ads per keyword")
+    args = parser.parse_args()
+
+    print(f"🧪 {args.advertisers} advertisers, 0-{args.max_ads} ads per keyword")
+    print("=" * 80)
+    print(f"{'rows':>10} {'legacy loops':>14} {'store totals':>13} {'speed-up':>9} {'main term breakdown':>21}")
+
+    for rows in args.rows:
+        results = build_store(rows, args.advertisers, args.max_ads)
+        summary_df = results.summary_frame()
+        (legacy_unique, legacy_top), legacy_time = timed(run_legacy, summary_df)
+        (unique, top), totals_time = timed(run_totals, results)
+        _, breakdown_time = timed(run_breakdown, results)
+
+        if unique != legacy_unique or [count for _, count in top] != list(legacy_top['Count']):
+            print(f"   ⚠️ results differ at {rows} rows")
+        print(f"{rows:>10} {legacy_time:>13.3f}s {totals_time:>12.4f}s "
+              f"{legacy_time / totals_time:>8.0f}x {breakdown_time:>20.3f}s")
+
+
+if __name__ == "__main__":
+    main()
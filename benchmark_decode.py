@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Response Decoding Benchmark
+Compares the old full response.json() decode against the projecting
+decoders, using bodies shaped like the real diag=enabled ISP payload
+"""
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+from mock_isp_server import build_payload
+from response_decoder import AVAILABLE_DECODERS, DECODER_PREFERENCE, get_decoder
+
+
+def decode_legacy(body):
+    """The pre-projection approach: decode everything, keep the raw text_ads"""
+    return json.loads(body).get('text_ads', [])
+
+
+def measure_speed(decode, bodies, rounds):
+    """Return decoded bytes per second over ``rounds`` passes"""
+    total_bytes = sum(len(body) for body in bodies) * rounds
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for body in bodies:
+            decode(body)
+    return total_bytes / (time.perf_counter() - start)
+
+
+def measure_memory(decode, bodies):
+    """Return (peak transient bytes, retained blocks) per response
+
+    Peak transient bytes is the most memory a single decode held at once.
+    Retained blocks counts the allocations still alive while the results
+    are kept, as they are in the caches and results.
+    """
+    peak = 0
+    for body in bodies:
+        tracemalloc.start()
+        decode(body)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    results = []
+    blocks_before = sys.getallocatedblocks()
+    for body in bodies:
+        results.append(decode(body))
+    retained = (sys.getallocatedblocks() - blocks_before) / len(bodies)
+    return peak, retained
+
+
+def report(label, speed, peak, retained):
+    print(f"{label:<24} {speed / 1e6:8.1f} MB/s  {peak / 1024:9.1f} KiB peak  {retained:8.1f} blocks/response")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ISP response decoders")
+    parser.add_argument("--responses", type=int, default=500)
+    parser.add_argument("--ads", type=int, default=20, help="Ads per response")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    bodies = [json.dumps(build_payload(f"keyword {i}", args.ads)).encode() for i in range(args.responses)]
+    average = sum(len(body) for body in bodies) / len(bodies)
+
+    print(f"🧪 {args.responses} responses, {args.ads} ads each, {average / 1024:.1f} KiB average")
+    print("=" * 80)
+
+    report("response.json() (full)", measure_speed(decode_legacy, bodies, args.rounds),
+           *measure_memory(decode_legacy, bodies))
+    for name in DECODER_PREFERENCE:
+        if not AVAILABLE_DECODERS[name]:
+            print(f"{name:<24} not installed")
+            continue
+        decode = get_decoder(name)
+        report(f"{name} + projection", measure_speed(decode, bodies, args.rounds),
+               *measure_memory(decode, bodies))
+
+
+if __name__ == "__main__":
+    main()
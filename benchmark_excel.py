@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Excel Export Benchmark
+Compares the old in-memory pandas/openpyxl Excel export against the
+streaming writers in result_exports, on synthetic results
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from result_exports import AVAILABLE_EXCEL_ENGINES, EXCEL_ENGINE_PREFERENCE, EXCEL_MAX_ROWS, write_excel
+from result_store import ResultStore
+
+
+def build_store(rows: int, advertisers: int, max_ads: int, seed: int = 0) -> ResultStore:
+    """A finished run's store: ``rows`` keywords, each with 0-``max_ads`` ads"""
+    rng = np.random.default_rng(seed)
+    ad_counts = rng.integers(0, max_ads + 1, size=rows).tolist()
+    # Skewed popularity, like real advertisers
+    ad_codes = np.minimum(rng.zipf(1.3, size=sum(ad_counts)) - 1, advertisers - 1).tolist()
+    scores = rng.random(size=len(ad_codes)).round(3).tolist()
+
+    store = ResultStore()
+    ad = 0
+    for index, ad_count in enumerate(ad_counts):
+        query_id = store.add_query()
+        store.add_row({
+            'index': index,
+            'data_item': index // 1000 + 1,
+            'main_term': f"term {index // 100}",
+            'keyword': f"keyword {index}",
+        }, query_id)
+        store.set_ads(query_id, [
+            {'adv_name': f"Advertiser {code}", 'keywordMatchingResult': {'relevanceScore': score}}
+            for code, score in zip(ad_codes[ad:ad + ad_count], scores[ad:ad + ad_count])
+        ])
+        ad += ad_count
+    return store
+
+
+def write_legacy(results: ResultStore, path: str):
+    """The pre-streaming export: both sheets as whole DataFrames through pandas and openpyxl"""
+    with pd.ExcelWriter(path, engine='openpyxl') as writer:
+        results.summary_frame().to_excel(writer, sheet_name='Summary', index=False)
+        detailed_df = results.detailed_frame()
+        if not detailed_df.empty:
+            detailed_df.to_excel(writer, sheet_name='Detailed', index=False)
+
+
+def peak_rss() -> int:
+    """Peak resident memory of this process, in bytes"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run_case(engine, store_args, max_rows, queue):
+    """Build the store, then time one export; runs in a fresh process so peaks don't mix"""
+    store = build_store(*store_args)
+    baseline = peak_rss()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'export.xlsx')
+        start = time.perf_counter()
+        if engine == 'legacy':
+            write_legacy(store, path)
+        else:
+            write_excel(store, path, engine=engine, max_rows=max_rows)
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(path)
+    queue.put((elapsed, peak_rss() - baseline, size, store.total_ads))
+
+
+def measure(engine, store_args, max_rows):
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=run_case, args=(engine, store_args, max_rows, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Excel export writers")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--advertisers", type=int, default=5000)
+    parser.add_argument("--max-ads", type=int, default=10, help="Maximum ads per keyword")
+    parser.add_argument("--sheet-rows", type=int, default=EXCEL_MAX_ROWS,
+                        help="Rows per sheet before splitting (lower it to exercise splitting)")
+    parser.add_argument("--skip-legacy", action="store_true", help="Skip the slow in-memory export")
+    args = parser.parse_args()
+
+    engines = ([] if args.skip_legacy else ['legacy']) + [
+        name for name in EXCEL_ENGINE_PREFERENCE if AVAILABLE_EXCEL_ENGINES[name]
+    ]
+    print(f"🧪 {args.advertisers} advertisers, 0-{args.max_ads} ads per keyword, "
+          f"{args.sheet_rows:,} rows per sheet")
+    print("=" * 80)
+    print(f"{'rows':>10} {'ad rows':>10} {'writer':<12} {'time':>9} {'peak extra memory':>18} {'file size':>10}")
+
+    for rows in args.rows:
+        store_args = (rows, args.advertisers, args.max_ads)
+        for engine in engines:
+            elapsed, memory, size, ad_rows = measure(engine, store_args, args.sheet_rows)
+            print(f"{rows:>10,} {ad_rows:>10,} {engine:<12} {elapsed:>8.2f}s "
+                  f"{memory / 2**20:>14.1f} MiB {size / 2**20:>6.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
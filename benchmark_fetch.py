@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Fetch Engine Benchmark
+Compares the old per-batch ThreadPoolExecutor against the async fetch engine
+using a local mock ISP server
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from fetch_engine import HEADERS, FetchEngine
+from mock_isp_server import start_mock_server
+
+
+def run_legacy(url_template, keywords, batch_size=20, max_workers=10):
+    """The pre-engine approach: a fresh 10-thread pool for every 20-keyword batch"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+    session.mount("http://", adapter)
+
+    def fetch(keyword):
+        response = session.get(url_template.format(keyword, "FR", "desktop"), headers=HEADERS, timeout=30)
+        response.raise_for_status()
+        return response.json().get('text_ads', [])
+
+    for i in range(0, len(keywords), batch_size):
+        batch = keywords[i:i + batch_size]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(fetch, keyword) for keyword in batch]
+            for future in as_completed(futures):
+                future.result()
+    session.close()
+
+
+def run_engine(url_template, keywords, max_concurrency):
+    """The async engine fed with one flat task stream"""
+    tasks = ({'keyword': k, 'country_code': "FR", 'form_factor': "desktop"} for k in keywords)
+    errors = 0
+    with FetchEngine(max_concurrency=max_concurrency, url_template=url_template) as engine:
+        for _, _, error in engine.fetch_many(tasks):
+            errors += error is not None
+    return errors
+
+
+def report(label, count, elapsed):
+    print(f"{label:<32} {count:>7} requests  {elapsed:7.2f}s  {count / elapsed:9.1f} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the fetch engine against a mock ISP server")
+    parser.add_argument("--keywords", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.05, help="Mock server latency in seconds")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 100, 300])
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    url_template = start_mock_server(port=args.port, latency=args.latency)
+    keywords = [f"keyword {i}" for i in range(args.keywords)]
+
+    print(f"🧪 Mock ISP latency {args.latency * 1000:.0f} ms, {args.keywords} keywords")
+    print("=" * 72)
+
+    start = time.perf_counter()
+    run_legacy(url_template, keywords)
+    report("ThreadPoolExecutor (10/batch)", len(keywords), time.perf_counter() - start)
+
+    for concurrency in args.concurrency:
+        start = time.perf_counter()
+        errors = run_engine(url_template, keywords, concurrency)
+        report(f"FetchEngine (concurrency {concurrency})", len(keywords), time.perf_counter() - start)
+        if errors:
+            print(f"   ⚠️ {errors} requests failed")
+
+
+if __name__ == "__main__":
+    main()
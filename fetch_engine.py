@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Async Fetch Engine
+Keeps many ISP requests in flight from a single background event loop
+"""
+
+import asyncio
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+import aiohttp
+
+from adaptive_concurrency import AIMDController
+from rate_limiter import TokenBucket, create_rate_limiter
+from response_cache import MemoryLRUCache, ResponseCache
+from response_decoder import get_decoder
+from single_flight import SingleFlight
+
+# API endpoint template
+API_URL_TEMPLATE = (
+    'http://prod-ssp-engine-private.ric1.admarketplace.net/isp'
+    '?plid=cjqduwisj4&results-ta=100&qt={}&country-code={}'
+    '&region-code=&form-factor={}&os-family=windows'
+    '&v=2.0&out=json&diag=enabled&ctaid='
+)
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0',
+    'Accept': 'application/json'
+}
+
+# Same retry policy the old urllib3 Retry used, but slept on the event loop
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 1
+
+_DONE = object()
+
+# Tasks taken from the task stream per hop to the reader thread
+READ_BATCH = 64
+
+
+def _take(task_iter: Iterator[Dict], count: int) -> List[Dict]:
+    return list(itertools.islice(task_iter, count))
+
+
+class FetchError(Exception):
+    """Raised when a keyword could not be fetched from the ISP
+
+    ``category`` is one of 'connection', 'timeout', 'http', 'decode' or
+    'other'; HTTP failures also carry the response ``status``.
+    """
+
+    def __init__(self, category: str, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.category = category
+        self.status = status
+
+
+class _Retry(Exception):
+    """Internal signal that an attempt failed transiently and should be retried"""
+
+
+class FetchEngine:
+    """Runs ISP requests on an asyncio loop owned by a background thread"""
+
+    def __init__(self, max_concurrency: int = 100, timeout: float = 30,
+                 url_template: str = API_URL_TEMPLATE,
+                 rate_limiter: Optional[TokenBucket] = None,
+                 controller: Optional[AIMDController] = None,
+                 cache: Optional[ResponseCache] = None,
+                 memory_cache: Optional[MemoryLRUCache] = None,
+                 single_flight: Optional[SingleFlight] = None,
+                 decoder: Optional[Callable[[bytes], List[Dict]]] = None):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.url_template = url_template
+        self.rate_limiter = rate_limiter
+        self.controller = controller
+        self.cache = cache
+        self.memory_cache = memory_cache
+        self.single_flight = single_flight
+        self.decoder = decoder or get_decoder()
+        self.memory_hits = 0
+        self.coalesced = 0
+        self.api_calls = 0
+        self._loop = None
+        self._thread = None
+        self._http = None
+
+    def start(self):
+        """Start the event loop thread if it is not running yet"""
+        if self._thread is not None:
+            return
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="fetch-engine", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Close the HTTP client and stop the event loop thread"""
+        if self._thread is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._close_http(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    async def _get_http(self) -> aiohttp.ClientSession:
+        if self._http is None:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, ttl_dns_cache=300)
+            self._http = aiohttp.ClientSession(
+                connector=connector,
+                headers=HEADERS,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._http
+
+    async def _close_http(self):
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+
+    async def _fetch(self, keyword: str, country_code: str, form_factor: str) -> List[Dict]:
+        """Fetch the text ads for one keyword, from the caches when possible"""
+        key = (keyword, country_code, form_factor)
+        if self.memory_cache is not None:
+            ads = self.memory_cache.get(key)
+            if ads is not None:
+                self.memory_hits += 1
+                return ads
+
+        if self.single_flight is None:
+            return await self._fetch_uncached(key)
+
+        # Join an identical request already in flight, in any session
+        ads, coalesced = await self.single_flight.do(key, lambda: self._fetch_uncached(key))
+        if coalesced:
+            self.coalesced += 1
+        return ads
+
+    async def _fetch_uncached(self, key: Tuple[str, str, str]) -> List[Dict]:
+        keyword, country_code, form_factor = key
+        if self.cache is not None:
+            ads = self.cache.get(keyword, country_code, form_factor)
+            if ads is not None:
+                if self.memory_cache is not None:
+                    self.memory_cache.put(key, ads)
+                return ads
+
+        self.api_calls += 1
+        ads = await self._fetch_remote(keyword, country_code, form_factor)
+        if self.cache is not None:
+            self.cache.put(keyword, country_code, form_factor, ads)
+        if self.memory_cache is not None:
+            self.memory_cache.put(key, ads)
+        return ads
+
+    async def _fetch_remote(self, keyword: str, country_code: str, form_factor: str) -> List[Dict]:
+        """Fetch the text ads for one keyword from the ISP, retrying transient failures"""
+        http = await self._get_http()
+        url = self.url_template.format(quote(keyword, safe=''), country_code, form_factor)
+
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                return await self._attempt(http, url, keyword, retryable=attempt < MAX_RETRIES)
+            except _Retry:
+                # Back off without holding a concurrency slot
+                await asyncio.sleep(BACKOFF_FACTOR * (2 ** attempt))
+
+    async def _attempt(self, http: aiohttp.ClientSession, url: str, keyword: str, retryable: bool) -> List[Dict]:
+        # Take a concurrency slot before a token: a token reserved while
+        # queued for a slot is spent late, so queued requests would burst
+        # past the rate when slots free up. Every attempt, retries
+        # included, counts against the ISP's QPS.
+        if self.controller is not None:
+            await self.controller.acquire()
+        if self.rate_limiter is not None:
+            try:
+                await self.rate_limiter.acquire()
+            except BaseException:
+                if self.controller is not None:
+                    self.controller.abandon()
+                raise
+
+        started = time.monotonic()
+        outcome = 'connection'
+        try:
+            async with http.get(url) as response:
+                outcome = response.status
+                if response.status in RETRY_STATUSES and retryable:
+                    raise _Retry()
+                response.raise_for_status()
+                body = await response.read()
+                return self.decoder(body)
+        except asyncio.TimeoutError:
+            outcome = 'timeout'
+            if retryable:
+                raise _Retry()
+            raise FetchError('timeout', f'⏰ Request timeout for "{keyword}" - Please check your VPN connection')
+        except aiohttp.ClientResponseError as e:
+            raise FetchError('http', f'Failed for "{keyword}": HTTP {e.status} {e.message}', status=e.status)
+        except aiohttp.ClientConnectionError:
+            if retryable:
+                raise _Retry()
+            raise FetchError('connection', f'❌ Connection failed for "{keyword}" - Please ensure you are connected to the required VPN')
+        except ValueError as e:
+            raise FetchError('decode', f'Failed for "{keyword}": {e}')
+        except asyncio.CancelledError:
+            # Stopped by a cancelled job, not by the ISP: nothing to learn from it
+            outcome = None
+            if self.controller is not None:
+                self.controller.abandon()
+            raise
+        finally:
+            if self.controller is not None and outcome is not None:
+                self.controller.release(time.monotonic() - started, outcome)
+
+    async def _run(self, tasks: Iterable[Dict], results: queue.Queue):
+        # One long-lived pool of workers drains the whole task stream, so a
+        # slow keyword only ever holds up its own worker.
+        loop = asyncio.get_running_loop()
+        task_iter = iter(tasks)
+        task_queue = asyncio.Queue(maxsize=self.max_concurrency)
+        # The task stream may parse files or skip long runs of duplicates, so
+        # it is read on its own thread; the loop only awaits each batch
+        reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fetch-reader")
+
+        async def feed():
+            while True:
+                batch = await loop.run_in_executor(reader, _take, task_iter, READ_BATCH)
+                for task in batch:
+                    await task_queue.put(task)
+                if len(batch) < READ_BATCH:
+                    break
+            for _ in range(self.max_concurrency):
+                await task_queue.put(_DONE)
+
+        async def worker():
+            while True:
+                task = await task_queue.get()
+                if task is _DONE:
+                    return
+                try:
+                    ads = await self._fetch(task['keyword'], task['country_code'], task['form_factor'])
+                    results.put((task, ads, None))
+                except FetchError as e:
+                    results.put((task, [], e))
+                except Exception as e:
+                    results.put((task, [], FetchError('other', f'Failed for "{task["keyword"]}": {e}')))
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(self.max_concurrency)]
+        workers.append(asyncio.ensure_future(feed()))
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            for future in workers:
+                future.cancel()
+            raise
+        finally:
+            # A batch still being read is left to finish on its own
+            reader.shutdown(wait=False)
+            results.put(_DONE)
+
+    def fetch_many(self, tasks: Iterable[Dict]) -> Iterator[Tuple[Dict, List[Dict], Optional[FetchError]]]:
+        """Yield (task, ads, error) for each task as soon as its request completes
+
+        Each task is a dict with 'keyword', 'country_code' and 'form_factor'.
+        Results are handed back to the calling thread, so callers can update
+        the UI without touching the event loop.
+        """
+        self.start()
+        results = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(self._run(tasks, results), self._loop)
+        finished = False
+        try:
+            while True:
+                item = results.get()
+                if item is _DONE:
+                    finished = True
+                    break
+                yield item
+        finally:
+            if not finished:
+                future.cancel()
+        future.result()
+
+
+def create_fetch_engine(max_concurrency: int = 100, timeout: float = 30,
+                        requests_per_second: Optional[float] = None,
+                        rate_limiter: Optional[TokenBucket] = None,
+                        adaptive: bool = False,
+                        cache: Optional[ResponseCache] = None,
+                        memory_cache: Optional[MemoryLRUCache] = None,
+                        single_flight: Optional[SingleFlight] = None,
+                        url_template: str = API_URL_TEMPLATE,
+                        decoder: Optional[str] = None) -> FetchEngine:
+    """Create and return a started fetch engine
+
+    ``max_concurrency`` caps requests in flight and ``requests_per_second``
+    caps how fast new requests are sent; both are shared by all workers.
+    Passing a process-wide ``rate_limiter`` instead makes every engine
+    draw from one bucket, so parallel jobs share the rate rather than
+    each getting its own.
+    With ``adaptive`` an AIMD controller moves the in-flight limit between
+    1 and ``max_concurrency`` based on latency and 429/5xx responses.
+    Successful responses are read from and written to ``memory_cache``
+    and then ``cache`` if given. Passing a process-wide ``single_flight``
+    makes concurrent identical queries share one request. Responses are
+    decoded by the named ``decoder`` (see response_decoder), by default
+    the fastest one installed, keeping only the fields the analysis uses.
+    """
+    engine = FetchEngine(
+        max_concurrency=max_concurrency,
+        timeout=timeout,
+        url_template=url_template,
+        rate_limiter=rate_limiter if rate_limiter is not None else create_rate_limiter(requests_per_second),
+        controller=AIMDController(max_limit=max_concurrency) if adaptive else None,
+        cache=cache,
+        memory_cache=memory_cache,
+        single_flight=single_flight,
+        decoder=get_decoder(decoder),
+    )
+    engine.start()
+    return engine
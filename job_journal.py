@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Job Journal
+Append-only on-disk record of an analysis run, so interrupted runs can resume
+"""
+
+import json
+import os
+import shutil
+import time
+import uuid
+from typing import BinaryIO, Dict, Iterable, List, Optional, Tuple
+
+JOBS_DIR = 'jobs'
+
+# The input copy is named after its format; jobs created before that used input.json
+INPUT_FILES = {'json': 'input.json', 'ndjson': 'input.ndjson', 'csv': 'input.csv'}
+LEGACY_INPUT_FILE = 'input.json'
+META_FILE = 'job.json'
+RESULTS_FILE = 'results.jsonl'
+EXPORTS_DIR = 'exports'
+
+# Finished jobs are removed once older than this, and beyond this many
+FINISHED_JOB_RETENTION_DAYS = 7
+MAX_FINISHED_JOBS = 50
+
+
+class JobJournal:
+    """One job directory: the uploaded input, its settings and a results log
+
+    Every completed query is appended to ``results.jsonl`` and flushed
+    straight away, so a VPN drop, a browser refresh or a crash loses at
+    most the requests that were still in flight.
+    """
+
+    def __init__(self, job_dir: str):
+        self.job_dir = job_dir
+        self.job_id = os.path.basename(job_dir)
+        with open(os.path.join(job_dir, META_FILE), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self._results = None
+
+    @property
+    def settings(self) -> Dict:
+        return self.meta['settings']
+
+    @property
+    def input_path(self) -> str:
+        return os.path.join(self.job_dir, self.meta.get('input_file', LEGACY_INPUT_FILE))
+
+    @property
+    def exports_dir(self) -> str:
+        return os.path.join(self.job_dir, EXPORTS_DIR)
+
+    def clear_exports(self):
+        """Remove exports written from an earlier run's results"""
+        shutil.rmtree(self.exports_dir, ignore_errors=True)
+
+    def load_results(self) -> Dict[Tuple[str, str, str], List[Dict]]:
+        """Read back every successfully completed query, keyed by (keyword, country, form factor)
+
+        Failed queries are not returned, so resuming dispatches them again.
+        A torn last line from an interrupted write is ignored.
+        """
+        results = {}
+        path = os.path.join(self.job_dir, RESULTS_FILE)
+        if not os.path.exists(path):
+            return results
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                key = (record['keyword'], record['country_code'], record['form_factor'])
+                if record.get('error') is None:
+                    results[key] = record['ads']
+                else:
+                    results.pop(key, None)
+        return results
+
+    def append(self, query: Dict, ads: List[Dict], error: Optional[Exception] = None):
+        """Record one completed query"""
+        if self._results is None:
+            path = os.path.join(self.job_dir, RESULTS_FILE)
+            torn = os.path.exists(path) and os.path.getsize(path) > 0 and not _ends_with_newline(path)
+            self._results = open(path, 'a', encoding='utf-8')
+            if torn:
+                # Terminate a line cut short by an earlier interruption
+                self._results.write('\n')
+        record = {
+            'keyword': query['keyword'],
+            'country_code': query['country_code'],
+            'form_factor': query['form_factor'],
+            'ads': ads,
+            'error': None if error is None else {
+                'category': getattr(error, 'category', 'other'),
+                'message': str(error),
+            },
+        }
+        self._results.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+        self._results.flush()
+
+    def finish(self, completed: int, failed: int, total_queries: Optional[int] = None):
+        """Close the results log and record how the run ended
+
+        ``total_queries`` is recorded once the whole input has been read.
+        The job only counts as finished once every query has a saved result,
+        so cancelled runs and runs with failures stay resumable.
+        """
+        self.close()
+        if total_queries is not None:
+            self.meta['total_queries'] = total_queries
+        total_queries = self.meta.get('total_queries')
+        self.meta.update({
+            'finished': failed == 0 and total_queries is not None and completed >= total_queries,
+            'completed': completed,
+            'failed': failed,
+            'updated': time.strftime('%Y-%m-%d %H:%M:%S'),
+        })
+        _write_meta(self.job_dir, self.meta)
+
+    def close(self):
+        if self._results is not None:
+            self._results.close()
+            self._results = None
+
+
+def _ends_with_newline(path: str) -> bool:
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+
+def _write_meta(job_dir: str, meta: Dict):
+    tmp_path = os.path.join(job_dir, META_FILE + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, os.path.join(job_dir, META_FILE))
+
+
+def create_job(input_file: BinaryIO, file_name: str, settings: Dict, total_queries: Optional[int] = None,
+               jobs_dir: str = JOBS_DIR) -> JobJournal:
+    """Create a new job directory holding a copy of the input and its settings
+
+    The input is copied from the start of ``input_file`` in blocks. Leave
+    ``total_queries`` unset when it is only known once the run has read
+    the whole input.
+    """
+    job_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    job_dir = os.path.join(jobs_dir, job_id)
+    os.makedirs(job_dir)
+    input_name = INPUT_FILES[settings.get('input_format', 'json')]
+    input_file.seek(0)
+    with open(os.path.join(job_dir, input_name), 'wb') as f:
+        shutil.copyfileobj(input_file, f)
+    _write_meta(job_dir, {
+        'job_id': job_id,
+        'file_name': file_name,
+        'input_file': input_name,
+        'settings': settings,
+        'total_queries': total_queries,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'finished': False,
+    })
+    return JobJournal(job_dir)
+
+
+def open_job(job_id: str, jobs_dir: str = JOBS_DIR) -> JobJournal:
+    """Open an existing job by ID"""
+    return JobJournal(os.path.join(jobs_dir, job_id))
+
+
+def list_jobs(jobs_dir: str = JOBS_DIR, unfinished_only: bool = False) -> List[Dict]:
+    """List job metadata, newest first"""
+    if not os.path.isdir(jobs_dir):
+        return []
+    jobs = []
+    for job_id in sorted(os.listdir(jobs_dir), reverse=True):
+        meta_path = os.path.join(jobs_dir, job_id, META_FILE)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if unfinished_only and meta.get('finished'):
+            continue
+        jobs.append(meta)
+    return jobs
+
+
+def delete_job(job_id: str, jobs_dir: str = JOBS_DIR):
+    """Remove a job directory and everything in it"""
+    shutil.rmtree(os.path.join(jobs_dir, job_id), ignore_errors=True)
+
+
+def prune_jobs(jobs_dir: str = JOBS_DIR, keep: Iterable[str] = (),
+               max_age_days: float = FINISHED_JOB_RETENTION_DAYS, max_finished: int = MAX_FINISHED_JOBS) -> int:
+    """Remove finished jobs older than ``max_age_days`` or beyond the newest ``max_finished``
+
+    Unfinished jobs stay until they are resumed or discarded, and so do
+    the jobs in ``keep`` (e.g. the ones a running server still shows).
+    Directories left without a readable job.json are removed once they
+    are as old as a finished job would be. Returns how many were removed.
+    """
+    if not os.path.isdir(jobs_dir):
+        return 0
+    keep = set(keep)
+    cutoff = time.time() - max_age_days * 24 * 3600
+    finished = 0
+    removed = 0
+    for job_id in sorted(os.listdir(jobs_dir), reverse=True):
+        job_dir = os.path.join(jobs_dir, job_id)
+        if job_id in keep or not os.path.isdir(job_dir):
+            continue
+        meta_path = os.path.join(job_dir, META_FILE)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                done = json.load(f).get('finished', False)
+            updated = os.path.getmtime(meta_path)
+        except (OSError, ValueError):
+            done = True
+            updated = os.path.getmtime(job_dir)
+        if not done:
+            continue
+        finished += 1
+        if updated < cutoff or finished > max_finished:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            removed += 1
+    return removed
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Job Runner
+Runs analysis jobs on a background executor owned by the server process,
+independent of the Streamlit script rerun cycle
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+import pandas as pd
+
+from advertiser_stats import main_term_breakdown
+from fetch_engine import create_fetch_engine
+from job_journal import JobJournal
+from keyword_input import MAX_SKIPPED_NOTES, TaskStream, create_task_stream
+from keyword_plan import new_query, query_key
+from response_cache import create_response_cache
+from result_exports import export_path, write_export
+from result_store import ResultStore
+
+MAX_PARALLEL_JOBS = 2
+MAX_RETAINED_JOBS = 20
+# Sample keywords kept per error category
+ERROR_SAMPLES = 5
+RECENT_RESULTS = 20
+LIVE_TOP_ADVERTISERS = 10
+# Seconds a live results snapshot is reused for, however many sessions poll;
+# matches the apps' progress refresh rate
+LIVE_SNAPSHOT_INTERVAL = 0.25
+
+
+class AnalysisJob:
+    """One analysis run: streams the journal's input, replays saved results, fetches the rest
+
+    Keywords are read from the job's copy of the input while the run is
+    going, so the first requests go out before the file has been parsed.
+    All state is updated under a lock by the worker threads and read through
+    ``progress()`` by whichever Streamlit session is polling, so the run
+    never touches ``st.*`` and survives any number of reruns.
+    """
+
+    def __init__(self, journal: JobJournal, engine_options: Dict, cache_options: Optional[Dict] = None):
+        self.journal = journal
+        self.job_id = journal.job_id
+        self.file_name = journal.meta.get('file_name', '')
+        self.engine_options = engine_options
+        self.cache_options = cache_options
+
+        # Unique queries by (keyword, country, form factor), in dispatch order
+        self.queries = {}
+        self.total_tasks = 0
+        self.input_done = False
+        # The input's task stream while the job reads it, for its skipped-input notes
+        self._tasks = None
+
+        self.status = 'queued'
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.reloaded = 0
+        self.pending = 0
+        self.processed = 0
+        self.failed = 0
+        self.last_keyword = ''
+        # Failures counted by (category, HTTP status), in the order first seen
+        self.error_counts = OrderedDict()
+        self.recent_results = deque(maxlen=RECENT_RESULTS)
+        self._live = None
+        self._live_at = 0.0
+        self._breakdown = None
+        self.request_stats = {}
+        self.controller = None
+
+        self.results = ResultStore()
+
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self.status in ('queued', 'running')
+
+    def cancel(self):
+        """Ask the job to stop after the requests currently in flight"""
+        self._cancelled.set()
+        with self._lock:
+            if self.status == 'queued':
+                self.status = 'cancelled'
+
+    def export(self, name: str) -> str:
+        """Path of export ``name`` for a finished job, writing it on first request"""
+        if self.active:
+            raise RuntimeError("Exports are only available once the job has finished")
+        return write_export(self.results, name, self.journal.exports_dir)
+
+    def main_term_breakdown(self) -> pd.DataFrame:
+        """Per main term totals of a finished job, built on first request and kept for later reruns"""
+        if self.active:
+            raise RuntimeError("The breakdown is only available once the job has finished")
+        with self._lock:
+            if self._breakdown is None:
+                results = self.results
+                self._breakdown = main_term_breakdown(results.summary_frame(),
+                                                      results.detailed_frame(results.completed_rows()))
+            return self._breakdown
+
+    def prepared_export(self, name: str) -> Optional[str]:
+        """Path of export ``name`` if it has already been written, else None"""
+        path = export_path(name, self.journal.exports_dir)
+        return path if os.path.exists(path) else None
+
+    def progress(self) -> Dict:
+        """Snapshot of the job's progress for display"""
+        with self._lock:
+            elapsed = (self.finished or time.time()) - self.started if self.started else 0.0
+            return {
+                'job_id': self.job_id,
+                'file_name': self.file_name,
+                'status': self.status,
+                'error': self.error,
+                'total_queries': len(self.queries),
+                'total_tasks': self.total_tasks,
+                'input_done': self.input_done,
+                'data_items': self._tasks.data_items if self._tasks is not None else 0,
+                'skipped': self._tasks.skipped[:MAX_SKIPPED_NOTES] if self._tasks is not None else [],
+                'skipped_count': len(self._tasks.skipped) if self._tasks is not None else 0,
+                'reloaded': self.reloaded,
+                'pending': self.pending,
+                'processed': self.processed,
+                'failed': self.failed,
+                'last_keyword': self.last_keyword,
+                'error_counts': [
+                    dict(entry, samples=list(entry['samples'])) for entry in self.error_counts.values()
+                ],
+                'live': self._live_snapshot(),
+                'elapsed': elapsed,
+                'controller': self.controller.snapshot() if self.controller is not None else None,
+            }
+
+    def _count_error(self, query: Dict, error: Exception):
+        """Add a failure to the error table; call with the lock held"""
+        category = getattr(error, 'category', 'other')
+        status = getattr(error, 'status', None)
+        entry = self.error_counts.get((category, status))
+        if entry is None:
+            entry = self.error_counts[(category, status)] = {
+                'category': category,
+                'status': status,
+                'count': 0,
+                'samples': [],
+                'last_message': '',
+            }
+        entry['count'] += 1
+        if len(entry['samples']) < ERROR_SAMPLES:
+            entry['samples'].append(query['keyword'])
+        entry['last_message'] = str(error)
+
+    def _live_snapshot(self) -> Dict:
+        """Running totals, top advertisers and latest results; call with the lock held
+
+        Everything comes from the result store's running totals, so no
+        table is rebuilt however large the run, and the snapshot is
+        refreshed at most every LIVE_SNAPSHOT_INTERVAL seconds.
+        """
+        now = time.monotonic()
+        if self._live is None or now - self._live_at >= LIVE_SNAPSHOT_INTERVAL or not self.active:
+            results = self.results
+            self._live = {
+                'keywords_done': results.keywords_done,
+                'keywords_with_ads': results.keywords_with_ads,
+                'total_ads': results.total_ads,
+                'distinct_advertisers': results.distinct_advertisers,
+                'top_advertisers': results.top_advertisers(LIVE_TOP_ADVERTISERS),
+                'recent_results': list(self.recent_results),
+            }
+            self._live_at = now
+        return self._live
+
+    def _dispatch(self, tasks: TaskStream, completed_results: Dict) -> Iterator[Dict]:
+        """Yield each new query as its first task is read from the input
+
+        Runs on the fetch engine's reader thread. Every task gets a row in the
+        result store pointing at its query, so duplicates of a query that has
+        already finished, in this run or an earlier attempt, show its result
+        straight away.
+        """
+        for task in tasks:
+            key = query_key(task)
+            with self._lock:
+                self.total_tasks += 1
+                query = self.queries.get(key)
+                dispatch = query is None
+                if dispatch:
+                    query = self.queries[key] = new_query(key)
+                    query['id'] = self.results.add_query(query['country_code'], query['form_factor'])
+                    ads = completed_results.pop(key, None)
+                    if ads is not None:
+                        self.results.set_ads(query['id'], ads)
+                        self.reloaded += 1
+                        dispatch = False
+                    else:
+                        self.pending += 1
+                self.results.add_row(task, query['id'])
+            if dispatch:
+                yield query
+
+        with self._lock:
+            self.input_done = True
+
+    def run(self):
+        """Execute the job; called on a runner thread"""
+        with self._lock:
+            if self._cancelled.is_set():
+                return
+            self.status = 'running'
+            self.started = time.time()
+
+        cache = None
+        engine = None
+        input_file = None
+
+        try:
+            # Setup failures (cache or engine) end the job as failed like any other error
+            if self.cache_options is not None:
+                cache = create_response_cache(**self.cache_options)
+            engine = create_fetch_engine(cache=cache, **self.engine_options)
+            self.controller = engine.controller
+
+            # Results finished by an earlier attempt at this job are reloaded, not re-fetched
+            completed_results = self.journal.load_results()
+            self.journal.clear_exports()
+            input_file = open(self.journal.input_path, 'rb')
+            settings = self.journal.settings
+            tasks = create_task_stream(input_file, settings.get('input_format', 'json'),
+                                       settings['country_code'], settings['form_factor'],
+                                       reopen_input=lambda: open(self.journal.input_path, 'rb'))
+            self._tasks = tasks
+
+            results = engine.fetch_many(self._dispatch(tasks, completed_results))
+            for query, ads, error in results:
+                self.journal.append(query, ads, error)
+                with self._lock:
+                    self.results.set_ads(query['id'], ads, failed=error is not None)
+                    self.recent_results.appendleft({
+                        'keyword': query['keyword'],
+                        'ad_count': len(ads),
+                        'advertisers': ", ".join(ad['adv_name'] for ad in ads if ad.get('adv_name')),
+                    })
+                    self.processed += 1
+                    self.last_keyword = query['keyword']
+                    if error is not None:
+                        self.failed += 1
+                        self._count_error(query, error)
+                if self._cancelled.is_set():
+                    results.close()
+                    break
+
+            final_status = 'cancelled' if self._cancelled.is_set() else 'completed'
+        except Exception as e:
+            final_status = 'failed'
+            self.error = str(e)
+        finally:
+            if input_file is not None:
+                input_file.close()
+            request_stats = {'memory_hits': 0, 'disk_hits': 0, 'coalesced': 0, 'api_calls': 0}
+            if engine is not None:
+                engine.close()
+                request_stats.update(
+                    memory_hits=engine.memory_hits,
+                    coalesced=engine.coalesced,
+                    api_calls=engine.api_calls,
+                )
+            if cache is not None:
+                request_stats['disk_hits'] = cache.stats()['hits']
+                cache.close()
+            self.journal.finish(
+                completed=self.reloaded + self.processed - self.failed,
+                failed=self.failed,
+                total_queries=len(self.queries) if self.input_done else None,
+            )
+
+        with self._lock:
+            self.request_stats = request_stats
+            self.status = final_status
+            self.finished = time.time()
+
+
+class JobRunner:
+    """Background executor that queues and runs analysis jobs
+
+    Meant to be held once per server process (e.g. via st.cache_resource).
+    At most ``max_parallel_jobs`` run at once; the rest wait in the
+    executor's queue. Finished jobs are kept so any session can fetch
+    their results, up to ``max_retained`` of them.
+    """
+
+    def __init__(self, max_parallel_jobs: int = MAX_PARALLEL_JOBS, max_retained: int = MAX_RETAINED_JOBS):
+        self.max_retained = max_retained
+        self._executor = ThreadPoolExecutor(max_workers=max_parallel_jobs, thread_name_prefix="analysis-job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, job: AnalysisJob) -> str:
+        """Queue a job and return its ID"""
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._prune()
+        self._executor.submit(job.run)
+        return job.job_id
+
+    def get(self, job_id: str) -> Optional[AnalysisJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def remove(self, job_id: str):
+        """Forget a finished job; active jobs must be cancelled first"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.active:
+                raise RuntimeError("Cancel the job before removing it")
+            self._jobs.pop(job_id, None)
+
+    def is_active(self, job_id: str) -> bool:
+        job = self.get(job_id)
+        return job is not None and job.active
+
+    def jobs(self) -> List[AnalysisJob]:
+        """All retained jobs, newest first"""
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if not job.active]
+        for job_id in finished[:max(0, len(self._jobs) - self.max_retained)]:
+            del self._jobs[job_id]
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Keyword Ad Analysis CLI
+Headless batch mode for cron jobs: same input format and fetch engine as the
+Streamlit app, with results streamed straight to CSV, JSONL or Parquet
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+import zlib
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from fetch_engine import API_URL_TEMPLATE, FetchError, create_fetch_engine
+from keyword_input import TaskStream, create_task_stream, detect_input_format
+from keyword_plan import build_result, new_query, query_key
+from response_cache import create_response_cache
+from result_writers import concat_result_files, create_result_writer, detect_format
+
+# Seconds between progress lines on stderr
+PROGRESS_INTERVAL = 10
+
+
+def shard_of(key: Tuple[str, str, str], shards: int) -> int:
+    """The worker a query key belongs to; stable across processes, unlike hash()"""
+    return zlib.crc32('\0'.join(key).encode('utf-8')) % shards
+
+
+def write_rows(writer, tasks: List[Dict], ads: List[Dict], error: Optional[FetchError]):
+    for task in tasks:
+        summary_row, _ = build_result(task, ads)
+        summary_row['error'] = None if error is None else error.category
+        writer.write(summary_row)
+
+
+def fetch_shard(input_options: Dict, output: str, output_format: str, engine_options: Dict,
+                cache_options: Optional[Dict], shard: int = 0, shards: int = 1, label: str = '') -> Dict:
+    """Fetch the queries of an input file and stream their rows to ``output``
+
+    Tasks are read from the file while requests are in flight, and each
+    new (keyword, country, form factor) query is dispatched as soon as its
+    first task is read; later tasks asking for it join its rows, or are
+    written straight away once it has finished. With ``shards`` above 1
+    only the queries whose key falls in ``shard`` are fetched, so workers
+    reading the same file never send the same query twice.
+
+    Runs in the main process, or in a worker process when sharding.
+    """
+    cache = create_response_cache(**cache_options) if cache_options is not None else None
+    engine = create_fetch_engine(cache=cache, **engine_options)
+
+    input_path = input_options['path']
+    input_format = input_options['input_format'] or detect_input_format(input_path)
+    queries = {}
+    # Tasks read after their query had finished, written by the main thread
+    late_rows = deque()
+    lock = threading.Lock()
+    state = {'keywords': 0, 'input_done': False}
+
+    def dispatch(tasks: TaskStream) -> Iterator[Dict]:
+        """Yield each new query of this shard; runs on the fetch engine's reader thread"""
+        for task in tasks:
+            key = query_key(task)
+            if shards > 1 and shard_of(key, shards) != shard:
+                continue
+            with lock:
+                state['keywords'] += 1
+                query = queries.get(key)
+                if query is None:
+                    query = queries[key] = new_query(key)
+                    query['rows'].append(task)
+                    yield_query = True
+                else:
+                    if query['rows'] is None:
+                        late_rows.append((task, query))
+                    else:
+                        query['rows'].append(task)
+                    yield_query = False
+            if yield_query:
+                yield query
+        with lock:
+            state['input_done'] = True
+
+    errors = Counter()
+    processed = 0
+    rows = 0
+    skipped = []
+    last_report = time.perf_counter()
+    try:
+        with open(input_path, 'rb') as f, create_result_writer(output, output_format) as writer:
+            tasks = create_task_stream(f, input_format, input_options['default_country'],
+                                       input_options['default_form_factor'],
+                                       reopen_input=lambda: open(input_path, 'rb'))
+            for query, ads, error in engine.fetch_many(dispatch(tasks)):
+                with lock:
+                    query_rows = query['rows']
+                    # Only the result is kept; duplicates read from now on are written from it
+                    query.update(rows=None, ads=ads, error=error)
+                write_rows(writer, query_rows, ads, error)
+                while late_rows:
+                    task, done = late_rows.popleft()
+                    write_rows(writer, [task], done['ads'], done['error'])
+                processed += 1
+                if error is not None:
+                    errors[error.category] += 1
+                    print(str(error), file=sys.stderr)
+
+                now = time.perf_counter()
+                if now - last_report >= PROGRESS_INTERVAL:
+                    last_report = now
+                    with lock:
+                        dispatched = f"{len(queries)}{'' if state['input_done'] else '+'}"
+                    print(f"📊 {label}{processed}/{dispatched} queries, {sum(errors.values())} failed",
+                          file=sys.stderr)
+            while late_rows:
+                task, done = late_rows.popleft()
+                write_rows(writer, [task], done['ads'], done['error'])
+            rows = writer.rows
+            # Every worker reads the whole file; the first one reports what it skipped
+            if shard == 0:
+                skipped = tasks.skipped
+    finally:
+        engine.close()
+        disk_hits = 0
+        if cache is not None:
+            disk_hits = cache.stats()['hits']
+            cache.close()
+
+    return {
+        'processed': processed,
+        'rows': rows,
+        'errors': errors,
+        'disk_hits': disk_hits,
+        'api_calls': engine.api_calls,
+        'keywords': state['keywords'],
+        'queries': len(queries),
+        'skipped': skipped,
+    }
+
+
+def run_sharded(input_options: Dict, args, engine_options: Dict, cache_options: Optional[Dict]) -> Dict:
+    """Fetch the input's queries in worker processes, then join their part files
+
+    Every worker reads the input and takes the queries whose key hashes to
+    it, so no plan is built up front and duplicates of a query always meet
+    in the same worker. Each worker has its own event loop and decodes its
+    own responses, so the work spreads over ``args.workers`` cores. The
+    concurrency and requests/sec limits are divided between the workers so
+    the totals sent to the ISP stay the same.
+    """
+    output_format = args.format or detect_format(args.output)
+    workers = args.workers
+    shard_options = dict(engine_options)
+    shard_options['max_concurrency'] = max(1, engine_options['max_concurrency'] // workers)
+    if engine_options['requests_per_second']:
+        shard_options['requests_per_second'] = engine_options['requests_per_second'] / workers
+
+    part_paths = [f"{args.output}.part-{i:03d}" for i in range(workers)]
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(fetch_shard, input_options, part_path, output_format, shard_options,
+                                cache_options, i, workers, f"[shard {i + 1}/{workers}] ")
+                for i, part_path in enumerate(part_paths)
+            ]
+            reports = [future.result() for future in futures]
+        concat_result_files(part_paths, args.output, output_format)
+    finally:
+        for part_path in part_paths:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+    return {
+        'processed': sum(report['processed'] for report in reports),
+        'rows': sum(report['rows'] for report in reports),
+        'errors': sum((report['errors'] for report in reports), Counter()),
+        'disk_hits': sum(report['disk_hits'] for report in reports),
+        'api_calls': sum(report['api_calls'] for report in reports),
+        'keywords': sum(report['keywords'] for report in reports),
+        'queries': sum(report['queries'] for report in reports),
+        'skipped': reports[0]['skipped'],
+    }
+
+
+def run_analysis(args) -> Dict:
+    """Fetch every keyword in the input file and stream rows to the output file"""
+    input_options = {
+        'path': args.input,
+        'input_format': args.input_format,
+        'default_country': args.country_code,
+        'default_form_factor': args.form_factor,
+    }
+    engine_options = {
+        'max_concurrency': args.concurrency,
+        'timeout': args.timeout,
+        'requests_per_second': args.rps,
+        'adaptive': args.adaptive,
+        'url_template': args.api_url,
+        'decoder': args.decoder,
+    }
+    cache_options = None if args.no_cache else {
+        'ttl_hours': args.cache_ttl_hours,
+        'max_size_mb': args.cache_max_mb,
+    }
+
+    started = time.perf_counter()
+    if args.workers > 1:
+        report = run_sharded(input_options, args, engine_options, cache_options)
+    else:
+        report = fetch_shard(input_options, args.output, args.format, engine_options, cache_options)
+    report['elapsed'] = time.perf_counter() - started
+    for note in report.pop('skipped'):
+        print(f"⚠️ {note}, skipping...", file=sys.stderr)
+    return report
+
+
+def print_report(report: Dict, output: str):
+    """Print throughput and error counts for the finished run"""
+    elapsed = report['elapsed']
+    failed = sum(report['errors'].values())
+    print("=" * 60)
+    print(f"✅ Wrote {report['rows']} rows to {output}")
+    print(f"   Keywords:   {report['keywords']} ({report['queries']} unique queries)")
+    print(f"   Elapsed:    {elapsed:.1f}s")
+    print(f"   Throughput: {report['processed'] / elapsed if elapsed else 0.0:.1f} queries/s")
+    print(f"   API calls:  {report['api_calls']} ({report['disk_hits']} served from cache)")
+    print(f"   Failed:     {failed}")
+    for category, count in report['errors'].most_common():
+        print(f"     {category:<12} {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a keyword ad analysis without the Streamlit UI")
+    parser.add_argument("input", help="JSON, NDJSON or CSV file with search terms (same formats as the app)")
+    parser.add_argument("--input-format", choices=['json', 'ndjson', 'csv'],
+                        help="Input format (default: from the input file extension)")
+    parser.add_argument("-o", "--output", required=True, help="Output file (.csv, .jsonl or .parquet)")
+    parser.add_argument("--format", choices=['csv', 'jsonl', 'parquet'],
+                        help="Output format (default: from the output file extension)")
+    parser.add_argument("--country-code", default="FR", help="Country code for items that don't set one")
+    parser.add_argument("--form-factor", default="desktop", help="Form factor for items that don't set one")
+    parser.add_argument("--concurrency", type=int, default=50, help="Maximum requests in flight")
+    parser.add_argument("--rps", type=float, default=10, help="Maximum requests per second")
+    parser.add_argument("--timeout", type=float, default=30, help="Request timeout in seconds")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes; queries are split between them by a hash of the keyword")
+    parser.add_argument("--decoder", choices=['simdjson', 'orjson', 'json'],
+                        help="Response JSON decoder (default: the fastest one installed)")
+    parser.add_argument("--adaptive", action="store_true", help="Adapt concurrency to ISP latency and 429/503s")
+    parser.add_argument("--no-cache", action="store_true", help="Don't read or write the response cache")
+    parser.add_argument("--cache-ttl-hours", type=float, default=24)
+    parser.add_argument("--cache-max-mb", type=int, default=512)
+    parser.add_argument("--api-url", default=API_URL_TEMPLATE, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    try:
+        report = run_analysis(args)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(2)
+
+    print_report(report, args.output)
+    sys.exit(1 if report['errors'] else 0)
+
+
+if __name__ == "__main__":
+    main()
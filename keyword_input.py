@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+Keyword Input
+Streams keyword tasks out of JSON, NDJSON and CSV input files without loading them whole
+"""
+
+import abc
+import csv
+import io
+import json
+import os
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+from keyword_plan import MIN_KEYWORD_LENGTH
+
+# Optional incremental JSON parser
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+except ImportError:
+    IJSON_AVAILABLE = False
+
+# Data items and keywords per main term kept for the upload preview
+PREVIEW_ITEMS = 5
+PREVIEW_TERMS = 5
+PREVIEW_KEYWORDS = 5
+
+# Keywords scan_input reads at most, so the upload preview stays quick on any file
+PREVIEW_SCAN_KEYWORDS = 10_000
+
+# Skipped-input notes kept for display; the rest are only counted
+MAX_SKIPPED_NOTES = 50
+
+
+class InvalidInputError(ValueError):
+    """Raised when an input file is not valid JSON"""
+
+
+def _value_events(value) -> Iterator[Tuple[str, object]]:
+    """Produce ijson-style basic_parse events from an already decoded value"""
+    if isinstance(value, dict):
+        yield 'start_map', None
+        for key, item in value.items():
+            yield 'map_key', key
+            yield from _value_events(item)
+        yield 'end_map', None
+    elif isinstance(value, list):
+        yield 'start_array', None
+        for item in value:
+            yield from _value_events(item)
+        yield 'end_array', None
+    elif isinstance(value, str):
+        yield 'string', value
+    else:
+        yield 'number', value
+
+
+def _parse_events(input_file: BinaryIO) -> Iterator[Tuple[str, object]]:
+    """Parse events for a JSON file, incrementally when ijson is installed"""
+    if not IJSON_AVAILABLE:
+        try:
+            value = json.load(input_file)
+        except ValueError as e:
+            raise InvalidInputError(str(e))
+        yield from _value_events(value)
+        return
+
+    try:
+        yield from ijson.basic_parse(input_file, use_float=True)
+    except ijson.JSONError as e:
+        raise InvalidInputError(str(e))
+
+
+class TaskStream(abc.ABC):
+    """The fetch tasks of one input file, produced while the file is parsed
+
+    Each task is a dict with its position in the file ('index'), the
+    'data_item' and 'main_term' it belongs to, the 'keyword' and the
+    'country_code' / 'form_factor' to query it with, so results can be
+    routed back in any completion order. ``skipped`` and ``data_items``
+    fill in as iteration goes on.
+    """
+
+    def __init__(self, input_file: BinaryIO, default_country: str, default_form_factor: str):
+        self.input_file = input_file
+        self.default_country = default_country
+        self.default_form_factor = default_form_factor
+        self.skipped: List[str] = []
+        self.data_items = 0
+        self.tasks = 0
+
+    def _task(self, data_item: int, main_term: str, keyword: str,
+              country_code: Optional[str] = None, form_factor: Optional[str] = None) -> Dict:
+        task = {
+            'index': self.tasks,
+            'data_item': data_item,
+            'main_term': main_term,
+            'keyword': keyword,
+            'country_code': country_code or self.default_country,
+            'form_factor': form_factor or self.default_form_factor,
+        }
+        self.tasks += 1
+        return task
+
+    @abc.abstractmethod
+    def __iter__(self) -> Iterator[Dict]:
+        """Yield the tasks in file order"""
+
+
+def _item_starts(event: str, depth: int, path: List[Optional[str]]) -> bool:
+    """Whether a data item starts here: the root map or a map in the root array"""
+    return event == 'start_map' and (depth == 0 or (depth == 1 and path[0] is None))
+
+
+def scan_item_settings(input_file: BinaryIO) -> Dict[int, Dict[str, str]]:
+    """Find the data items whose 'country-code' or 'form-factor' follows their search terms
+
+    Returns those settings by data item index (from 0). Only the settings
+    are kept, so memory stays small however many keywords the file has.
+    """
+    path: List[Optional[str]] = []
+    item_depth = None
+    item_index = -1
+    seen_terms = False
+    late_settings = {}
+
+    for event, value in _parse_events(input_file):
+        depth = len(path)
+        if event == 'map_key':
+            path[-1] = value
+            continue
+        if event in ('end_map', 'end_array'):
+            path.pop()
+            if event == 'end_map' and len(path) == item_depth:
+                item_depth = None
+            continue
+
+        if item_depth is None:
+            if _item_starts(event, depth, path):
+                item_depth = depth
+                item_index += 1
+                seen_terms = False
+        elif depth == item_depth + 1:
+            if path[-1] == 'search-terms':
+                seen_terms = True
+            elif path[-1] in ('country-code', 'form-factor') and event == 'string' and seen_terms:
+                late_settings.setdefault(item_index, {})[path[-1]] = value
+
+        if event in ('start_map', 'start_array'):
+            path.append(None)
+    return late_settings
+
+
+class JSONTaskStream(TaskStream):
+    """Tasks from the app's nested JSON layout
+
+    One data item or a list of them, each with optional 'country-code' /
+    'form-factor' and a 'search-terms' map of main term -> keyword
+    variations. Tasks are yielded as soon as their keyword has been read,
+    so only one keyword is held at a time.
+
+    A data item's 'country-code' or 'form-factor' may follow its search
+    terms. With ``reopen_input``, a callable opening the same file again,
+    the first such item triggers one scan_item_settings() pass over a
+    second handle, and no keywords are held back. Without it, that item's
+    keywords are held until it ends.
+    """
+
+    def __init__(self, input_file: BinaryIO, default_country: str, default_form_factor: str,
+                 reopen_input: Optional[Callable[[], BinaryIO]] = None):
+        super().__init__(input_file, default_country, default_form_factor)
+        self.reopen_input = reopen_input
+        self._late_settings = None
+
+    def _item_settings(self, item_index: int, settings: Dict[str, str]) -> Optional[Dict[str, str]]:
+        """An item's full settings while its keys may still follow, or None if they are unknown"""
+        if 'country-code' in settings and 'form-factor' in settings:
+            return settings
+        if self._late_settings is None:
+            if self.reopen_input is None:
+                return None
+            with self.reopen_input() as f:
+                self._late_settings = scan_item_settings(f)
+        return {**settings, **self._late_settings.get(item_index, {})}
+
+    def __iter__(self) -> Iterator[Dict]:
+        # One entry per open container: the current key for maps, None for arrays
+        path: List[Optional[str]] = []
+        item_depth = None
+        item_index = -1
+        settings = {}
+        held = []
+        main_terms = 0
+        main_term = None
+        valid_keywords = 0
+
+        for event, value in _parse_events(self.input_file):
+            depth = len(path)
+
+            if event == 'map_key':
+                path[-1] = value
+                continue
+
+            if event in ('end_map', 'end_array'):
+                path.pop()
+                depth = len(path)
+                if event == 'end_array' and item_depth is not None and depth == item_depth + 2 \
+                        and main_term is not None:
+                    if not valid_keywords:
+                        self.skipped.append(f"Data item {item_index + 1}, {main_term}: no valid keywords found")
+                    main_term = None
+                elif event == 'end_map' and depth == item_depth:
+                    if not main_terms:
+                        self.skipped.append(f"Data item {item_index + 1}: no search terms found")
+                    for held_term, keyword in held:
+                        yield self._task(item_index + 1, held_term, keyword,
+                                         settings.get('country-code'), settings.get('form-factor'))
+                    held = []
+                    item_depth = None
+                continue
+
+            # A value starts at ``depth``
+            if item_depth is None:
+                if _item_starts(event, depth, path):
+                    item_depth = depth
+                    item_index += 1
+                    self.data_items += 1
+                    settings = {}
+                    main_terms = 0
+            elif depth == item_depth + 1:
+                if path[-1] in ('country-code', 'form-factor') and event == 'string':
+                    settings[path[-1]] = value
+            elif depth == item_depth + 2 and path[item_depth] == 'search-terms' \
+                    and path[item_depth + 1] is not None:
+                main_terms += 1
+                if event == 'start_array':
+                    main_term = path[-1]
+                    valid_keywords = 0
+            elif depth == item_depth + 3 and main_term is not None and event == 'string':
+                keyword = value.strip()
+                if len(keyword) >= MIN_KEYWORD_LENGTH:
+                    valid_keywords += 1
+                    item_settings = self._item_settings(item_index, settings)
+                    if item_settings is not None:
+                        yield self._task(item_index + 1, main_term, keyword,
+                                         item_settings.get('country-code'), item_settings.get('form-factor'))
+                    else:
+                        held.append((main_term, keyword))
+
+            if event in ('start_map', 'start_array'):
+                path.append(None)
+
+
+class _FlatTaskStream(TaskStream):
+    """Tasks from one-keyword-per-record files
+
+    Each record has 'keyword' and optionally 'main_term', 'country' and
+    'form_factor'; empty settings fall back to the defaults. Flat files
+    have no data items, so every task belongs to data item 1.
+    """
+
+    @abc.abstractmethod
+    def _records(self) -> Iterator[Tuple[int, Dict]]:
+        """Yield (line number, record) for each record in the file"""
+
+    def __iter__(self) -> Iterator[Dict]:
+        for line_number, record in self._records():
+            self.data_items = 1
+            keyword = str(record.get('keyword') or '').strip()
+            if len(keyword) < MIN_KEYWORD_LENGTH:
+                self.skipped.append(f"Line {line_number}: no valid keyword found")
+                continue
+            yield self._task(1, str(record.get('main_term') or ''), keyword,
+                             record.get('country'), record.get('form_factor'))
+
+
+class NDJSONTaskStream(_FlatTaskStream):
+    """Tasks from newline-delimited JSON, one object per line"""
+
+    def _records(self) -> Iterator[Tuple[int, Dict]]:
+        for line_number, line in enumerate(self.input_file, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise InvalidInputError(f"Line {line_number}: {e}")
+            if not isinstance(record, dict):
+                raise InvalidInputError(f"Line {line_number}: expected a JSON object")
+            yield line_number, record
+
+
+class CSVTaskStream(_FlatTaskStream):
+    """Tasks from a CSV file with a header row naming its columns"""
+
+    def _records(self) -> Iterator[Tuple[int, Dict]]:
+        text = io.TextIOWrapper(self.input_file, encoding='utf-8-sig', newline='')
+        try:
+            reader = csv.DictReader(text)
+            if reader.fieldnames is None or 'keyword' not in reader.fieldnames:
+                raise InvalidInputError("CSV input needs a header row with a 'keyword' column")
+            for record in reader:
+                # Header is line 1
+                yield reader.line_num, record
+        except (csv.Error, UnicodeDecodeError) as e:
+            raise InvalidInputError(str(e))
+        finally:
+            # Leave the caller's file open
+            text.detach()
+
+
+TASK_STREAMS = {
+    'json': JSONTaskStream,
+    'ndjson': NDJSONTaskStream,
+    'csv': CSVTaskStream,
+}
+
+INPUT_FORMATS = {
+    '.json': 'json',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+    '.csv': 'csv',
+}
+
+
+def detect_input_format(path: str) -> str:
+    """Guess the input format from a file extension"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in INPUT_FORMATS:
+        raise ValueError(f"Cannot tell the input format of {path}; use .json, .ndjson, .jsonl or .csv")
+    return INPUT_FORMATS[extension]
+
+
+def create_task_stream(input_file: BinaryIO, input_format: str, default_country: str,
+                       default_form_factor: str,
+                       reopen_input: Optional[Callable[[], BinaryIO]] = None) -> TaskStream:
+    """Create the task stream for a binary input file in ``input_format``
+
+    ``reopen_input`` opens the same file again; JSON streams use it to look
+    up settings that follow an item's search terms instead of holding its
+    keywords back.
+    """
+    if input_format == 'json':
+        return JSONTaskStream(input_file, default_country, default_form_factor, reopen_input)
+    return TASK_STREAMS[input_format](input_file, default_country, default_form_factor)
+
+
+def scan_input(input_file: BinaryIO, input_format: str, default_country: str, default_form_factor: str,
+               reopen_input: Optional[Callable[[], BinaryIO]] = None) -> Dict:
+    """Preview the start of an input file without reading all of it
+
+    Reads up to PREVIEW_ITEMS data items or PREVIEW_SCAN_KEYWORDS keywords,
+    whichever comes first, and returns the counts so far, the first
+    MAX_SKIPPED_NOTES skipped-input notes and a small preview of those
+    items. ``complete`` is true when the whole file was read, so the
+    counts are final; otherwise the running job fills them in.
+    """
+    stream = create_task_stream(input_file, input_format, default_country, default_form_factor, reopen_input)
+    preview = {}
+    complete = True
+    keywords = 0
+    for task in stream:
+        if task['data_item'] > PREVIEW_ITEMS or keywords >= PREVIEW_SCAN_KEYWORDS:
+            complete = False
+            break
+        keywords += 1
+        item = preview.get(task['data_item'])
+        if item is None:
+            item = preview[task['data_item']] = {
+                'country-code': task['country_code'],
+                'form-factor': task['form_factor'],
+                'keywords': 0,
+                'search-terms': {},
+            }
+        item['keywords'] += 1
+        terms = item['search-terms']
+        if task['main_term'] in terms:
+            if len(terms[task['main_term']]) < PREVIEW_KEYWORDS:
+                terms[task['main_term']].append(task['keyword'])
+        elif len(terms) < PREVIEW_TERMS:
+            terms[task['main_term']] = [task['keyword']]
+
+    return {
+        'data_items': stream.data_items,
+        'total_keywords': keywords,
+        'complete': complete,
+        'skipped': stream.skipped[:MAX_SKIPPED_NOTES],
+        'skipped_count': len(stream.skipped),
+        'preview': preview,
+    }
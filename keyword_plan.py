@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Keyword Plan
+Turns fetch tasks into deduplicated queries and their results back into rows
+"""
+
+import unicodedata
+from typing import Dict, List, Tuple
+
+MIN_KEYWORD_LENGTH = 3
+
+
+def normalize_keyword(keyword: str) -> str:
+    """Canonical form used to spot duplicate queries
+
+    Applies Unicode NFC, case-folding and whitespace trimming/collapsing,
+    so "Gaming  Laptop " and "gaming laptop" become the same query.
+    """
+    return ' '.join(unicodedata.normalize('NFC', keyword).casefold().split())
+
+
+def query_key(task: Dict) -> Tuple[str, str, str]:
+    """The (normalised keyword, country, form factor) a task is queried as"""
+    return normalize_keyword(task['keyword']), task['country_code'], task['form_factor']
+
+
+def new_query(key: Tuple[str, str, str]) -> Dict:
+    """An empty query for ``key``, ready to collect the tasks that ask for it"""
+    keyword, country_code, form_factor = key
+    return {
+        'keyword': keyword,
+        'country_code': country_code,
+        'form_factor': form_factor,
+        'rows': [],
+    }
+
+
+def build_result(task: Dict, ads: List[Dict]) -> Tuple[Dict, Dict]:
+    """Build the summary row and detailed entry for one completed task"""
+    advertiser_names = []
+    details = []
+
+    for ad in ads:
+        name = ad.get('adv_name', '').strip()
+        score = ad.get('keywordMatchingResult', {}).get('relevanceScore', '')
+        if name:
+            advertiser_names.append(name)
+            details.append({
+                "advertiser_name": name,
+                "relevance_score": score
+            })
+
+    summary_row = {
+        "data_item": task['data_item'],
+        "main_term": task['main_term'],
+        "qt": task['keyword'],
+        "advertisers": ",".join(advertiser_names),
+        "ad_count": len(ads)
+    }
+
+    detailed_entry = {
+        "data_item": task['data_item'],
+        "main_term": task['main_term'],
+        "details": details
+    }
+
+    return summary_row, detailed_entry
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Mock ISP Server
+A local stand-in for the private ISP endpoint, used by the benchmarks
+"""
+
+import argparse
+import asyncio
+import random
+import threading
+
+from aiohttp import web
+
+
+def build_payload(keyword: str, ads_per_keyword: int) -> dict:
+    """Build a response shaped like the real diag=enabled ISP payload"""
+    text_ads = []
+    for i in range(ads_per_keyword):
+        text_ads.append({
+            'adv_name': f'Advertiser {hash((keyword, i)) % 500}',
+            'adv_id': 100000 + i,
+            'title': f'{keyword} - offer {i}',
+            'description': 'Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 3,
+            'click_url': f'https://example.com/click?kw={keyword}&ad={i}',
+            'impression_url': f'https://example.com/imp?kw={keyword}&ad={i}',
+            'keywordMatchingResult': {
+                'relevanceScore': round(random.random(), 4),
+                'matchType': 'broad',
+                'matchedTerms': keyword.split(),
+            },
+        })
+    return {
+        'text_ads': text_ads,
+        'diag': {
+            'request_id': random.getrandbits(64),
+            'timings': {'total_ms': 12, 'ranking_ms': 7, 'retrieval_ms': 4},
+            'candidates': [{'id': i, 'score': random.random()} for i in range(50)],
+        },
+    }
+
+
+def create_app(latency: float = 0.05, ads_per_keyword: int = 5, error_rate: float = 0.0) -> web.Application:
+    """Create the mock ISP web application"""
+
+    async def isp(request):
+        await asyncio.sleep(latency)
+        if error_rate and random.random() < error_rate:
+            return web.Response(status=random.choice([429, 503]))
+        keyword = request.query.get('qt', '')
+        return web.json_response(build_payload(keyword, ads_per_keyword))
+
+    app = web.Application()
+    app.router.add_get('/isp', isp)
+    return app
+
+
+def start_mock_server(port: int = 8765, **app_kwargs) -> str:
+    """Start the mock server in a background thread and return an API URL template"""
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(create_app(**app_kwargs), access_log=None)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, '127.0.0.1', port, backlog=2048)
+    loop.run_until_complete(site.start())
+    threading.Thread(target=loop.run_forever, name="mock-isp", daemon=True).start()
+    return (
+        f'http://127.0.0.1:{port}/isp'
+        '?plid=mock&results-ta=100&qt={}&country-code={}'
+        '&region-code=&form-factor={}&os-family=windows'
+        '&v=2.0&out=json&diag=enabled&ctaid='
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local mock ISP server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05, help="Response delay in seconds")
+    parser.add_argument("--ads", type=int, default=5, help="Ads returned per keyword")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of 429/503 responses")
+    args = parser.parse_args()
+
+    print(f"🧪 Mock ISP server listening on http://127.0.0.1:{args.port}/isp")
+    web.run_app(
+        create_app(latency=args.latency, ads_per_keyword=args.ads, error_rate=args.error_rate),
+        host='127.0.0.1', port=args.port, access_log=None, print=None,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Rate Limiter
+Token bucket shared by every fetch worker to cap ISP requests per second
+"""
+
+import asyncio
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """Token bucket that hands out request slots at a fixed rate
+
+    Callers reserve a token up front and sleep until it is due, so waiting
+    workers are served in order and the bucket never lets more than
+    ``burst`` requests through above the configured rate. The bucket is
+    guarded by a lock, so one instance can be shared across threads and
+    event loops.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = burst if burst is not None else 1.0
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate: float):
+        """Change the refill rate, keeping the tokens already earned"""
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        with self._lock:
+            self._refill()
+            self.rate = rate
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """Take one token and return how many seconds to wait before using it"""
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    async def acquire(self):
+        """Wait on the event loop until a request may be sent"""
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def create_rate_limiter(requests_per_second: Optional[float]) -> Optional[TokenBucket]:
+    """Create a token bucket, or None when rate limiting is disabled"""
+    if not requests_per_second:
+        return None
+    return TokenBucket(requests_per_second)
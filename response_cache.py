@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Response Cache
+Persistent SQLite cache and shared in-memory LRU of extracted ISP text ads,
+keyed by (qt, country-code, form-factor)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional
+
+DEFAULT_CACHE_PATH = os.path.join('.cache', 'isp_responses.sqlite3')
+DEFAULT_TTL_SECONDS = 24 * 3600
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# How many writes between checks of the total cache size
+EVICTION_CHECK_INTERVAL = 200
+
+DEFAULT_MEMORY_TTL_SECONDS = 3600
+DEFAULT_MEMORY_MAX_BYTES = 256 * 1024 * 1024
+
+
+class ResponseCache:
+    """On-disk cache of text ads with a TTL and size-based LRU eviction
+
+    A single connection is shared behind a lock, so one instance can be
+    used from the fetch engine's event loop and the UI thread alike.
+    Hit/miss counters cover the lifetime of the instance, so create one
+    per analysis run to get per-run stats.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                qt TEXT NOT NULL,
+                country_code TEXT NOT NULL,
+                form_factor TEXT NOT NULL,
+                ads TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (qt, country_code, form_factor)
+            ) WITHOUT ROWID
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self.purge_expired()
+
+    def get(self, keyword: str, country_code: str, form_factor: str) -> Optional[List[Dict]]:
+        """Return cached ads, or None if missing or older than the TTL"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT ads, fetched_at FROM responses WHERE qt = ? AND country_code = ? AND form_factor = ?",
+                (keyword, country_code, form_factor),
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE qt = ? AND country_code = ? AND form_factor = ?",
+                (now, keyword, country_code, form_factor),
+            )
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, keyword: str, country_code: str, form_factor: str, ads: List[Dict]):
+        """Store the ads for a key, replacing any older entry"""
+        payload = json.dumps(ads, ensure_ascii=False, separators=(',', ':'))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (keyword, country_code, form_factor, payload, len(payload), now, now),
+            )
+            self.writes += 1
+            if self.writes % EVICTION_CHECK_INTERVAL == 0:
+                self._evict()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        # Free down to 90% of the budget so we don't evict on every write
+        excess = total - int(self.max_bytes * 0.9)
+        victims = []
+        for qt, country_code, form_factor, size in self._conn.execute(
+            "SELECT qt, country_code, form_factor, size FROM responses ORDER BY accessed_at"
+        ):
+            victims.append((qt, country_code, form_factor))
+            excess -= size
+            if excess <= 0:
+                break
+        self._conn.executemany(
+            "DELETE FROM responses WHERE qt = ? AND country_code = ? AND form_factor = ?", victims
+        )
+        self.evictions += len(victims)
+
+    def purge_expired(self):
+        """Drop every entry older than the TTL"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE fetched_at < ?", (time.time() - self.ttl_seconds,))
+
+    def clear(self):
+        """Remove every cached response"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+    def stats(self) -> Dict:
+        """Hit/miss counters for this instance plus the size of the cache"""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'writes': self.writes,
+            'evictions': self.evictions,
+            'entries': entries,
+            'size_bytes': size,
+        }
+
+    def close(self):
+        with self._lock:
+            self._evict()
+            self._conn.close()
+
+
+class MemoryLRUCache:
+    """Thread-safe in-memory LRU with a TTL and a byte budget
+
+    Meant to be held once per process so every Streamlit session serves
+    keywords another session already fetched. Entry sizes are estimated
+    from their compact JSON encoding.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MEMORY_MAX_BYTES, ttl_seconds: float = DEFAULT_MEMORY_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[List[Dict]]:
+        """Return the cached value and mark it recently used, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, stored_at = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self._size -= size
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: List[Dict]):
+        """Store a value, evicting least recently used entries over budget"""
+        size = len(json.dumps(value, ensure_ascii=False, separators=(',', ':')))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+            self._entries[key] = (value, size, time.monotonic())
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        """Remove every entry"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict:
+        """Process-wide counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'size_bytes': self._size,
+            }
+
+
+def create_response_cache(ttl_hours: float = 24, max_size_mb: int = 512,
+                          path: str = DEFAULT_CACHE_PATH) -> ResponseCache:
+    """Create and return a response cache"""
+    return ResponseCache(path=path, ttl_seconds=ttl_hours * 3600, max_bytes=max_size_mb * 1024 * 1024)
+
+
+def create_memory_cache(max_size_mb: int = 256, ttl_hours: float = 1) -> MemoryLRUCache:
+    """Create and return an in-memory LRU cache"""
+    return MemoryLRUCache(max_bytes=max_size_mb * 1024 * 1024, ttl_seconds=ttl_hours * 3600)
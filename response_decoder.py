@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Response Decoder
+Decodes ISP response bodies and keeps only the fields the analysis uses
+"""
+
+import json
+import threading
+from typing import Callable, Dict, List, Optional
+
+# Optional fast JSON parsers
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import simdjson
+    SIMDJSON_AVAILABLE = True
+except ImportError:
+    SIMDJSON_AVAILABLE = False
+
+# Preferred decoders, fastest first
+DECODER_PREFERENCE = ['simdjson', 'orjson', 'json']
+
+
+def project_ad(ad) -> Dict:
+    """Keep only an ad's advertiser name and relevance score
+
+    The record keeps the ISP's field names, so build_result() reads
+    projected ads, cached ads and journalled raw ads alike.
+    """
+    matching = ad.get('keywordMatchingResult')
+    score = matching.get('relevanceScore', '') if matching is not None else ''
+    return {
+        'adv_name': ad.get('adv_name', ''),
+        'keywordMatchingResult': {'relevanceScore': score},
+    }
+
+
+def project_ads(data) -> List[Dict]:
+    """Project the 'text_ads' of a decoded response into compact ad records"""
+    if not hasattr(data, 'get'):
+        raise ValueError("ISP response is not a JSON object")
+    text_ads = data.get('text_ads')
+    if text_ads is None:
+        return []
+    return [project_ad(ad) for ad in text_ads]
+
+
+def decode_ads_json(body: bytes) -> List[Dict]:
+    """Standard library decoder: parses the whole body, then projects"""
+    return project_ads(json.loads(body))
+
+
+def decode_ads_orjson(body: bytes) -> List[Dict]:
+    """orjson decoder: parses the whole body in C, then projects"""
+    return project_ads(orjson.loads(body))
+
+
+_simdjson_local = threading.local()
+
+
+def decode_ads_simdjson(body: bytes) -> List[Dict]:
+    """simdjson decoder: only the projected fields are turned into Python objects
+
+    A parser can't be shared between threads, so each thread keeps its own.
+    After a failure the parser is replaced, since the traceback may still
+    reference its document and a parser refuses to parse while it does.
+    """
+    parser = getattr(_simdjson_local, 'parser', None)
+    if parser is None:
+        parser = _simdjson_local.parser = simdjson.Parser()
+    try:
+        return project_ads(parser.parse(body))
+    except RuntimeError as e:
+        _simdjson_local.parser = None
+        raise ValueError(str(e))
+    except Exception:
+        _simdjson_local.parser = None
+        raise
+
+
+DECODERS = {
+    'json': decode_ads_json,
+    'orjson': decode_ads_orjson,
+    'simdjson': decode_ads_simdjson,
+}
+
+AVAILABLE_DECODERS = {
+    'json': True,
+    'orjson': ORJSON_AVAILABLE,
+    'simdjson': SIMDJSON_AVAILABLE,
+}
+
+
+def get_decoder(name: Optional[str] = None) -> Callable[[bytes], List[Dict]]:
+    """Return the named decoder, or the fastest one installed
+
+    Decoders take a response body and return projected ads, raising
+    ValueError if the body can't be decoded.
+    """
+    if name is None:
+        name = next(candidate for candidate in DECODER_PREFERENCE if AVAILABLE_DECODERS[candidate])
+    if not AVAILABLE_DECODERS.get(name):
+        raise ValueError(f"Response decoder {name!r} is not installed")
+    return DECODERS[name]
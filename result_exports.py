@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Result Exports
+Write a ResultStore's summary and detailed tables to export files,
+chunk by chunk, only when an export is asked for
+"""
+
+import itertools
+import json
+import os
+import uuid
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from result_store import DETAILED_COLUMNS, SUMMARY_COLUMNS, ResultStore
+
+# Optional Parquet and Arrow IPC support
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    ARROW_AVAILABLE = True
+except ImportError:
+    ARROW_AVAILABLE = False
+
+# Optional faster Excel writer
+try:
+    import xlsxwriter
+    XLSXWRITER_AVAILABLE = True
+except ImportError:
+    XLSXWRITER_AVAILABLE = False
+
+# Rows per worksheet, header included, before Excel's limit forces a new sheet
+EXCEL_MAX_ROWS = 1_048_576
+
+# Task rows per chunk for Excel; cells become Python objects, so chunks stay small
+EXCEL_CHUNK_ROWS = 10_000
+
+# Preferred Excel writers, fastest first
+EXCEL_ENGINE_PREFERENCE = ['xlsxwriter', 'openpyxl']
+
+if ARROW_AVAILABLE:
+    SUMMARY_SCHEMA = pa.schema([
+        ('data_item', pa.int32()),
+        ('main_term', pa.string()),
+        ('qt', pa.string()),
+        ('advertisers', pa.string()),
+        ('ad_count', pa.int32()),
+    ])
+    DETAILED_SCHEMA = pa.schema([
+        ('keyword', pa.string()),
+        ('main_term', pa.string()),
+        ('data_item', pa.int32()),
+        ('advertiser', pa.string()),
+        ('relevance_score', pa.float64()),
+    ])
+
+
+def write_summary_csv(results: ResultStore, path: str):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        header = True
+        for frame in results.iter_summary_frames():
+            frame.to_csv(f, header=header, index=False)
+            header = False
+        if header:
+            results.summary_frame().to_csv(f, index=False)
+
+
+def write_failed_csv(results: ResultStore, path: str):
+    """Tasks whose query failed, as a CSV keyword file to upload for a retry run"""
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        header = True
+        for frame in results.iter_failed_frames():
+            frame.to_csv(f, header=header, index=False)
+            header = False
+        if header:
+            results.failed_frame().to_csv(f, index=False)
+
+
+def write_detailed_json(results: ResultStore, path: str):
+    """Same document as json.dumps(detailed_dict, indent=2), written one keyword at a time"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{')
+        separator = '\n'
+        for keyword, entry in results.iter_detailed():
+            entry_json = json.dumps(entry, ensure_ascii=False, indent=2).replace('\n', '\n  ')
+            f.write(f"{separator}  {json.dumps(keyword, ensure_ascii=False)}: {entry_json}")
+            separator = ',\n'
+        f.write('\n}' if separator != '\n' else '}')
+
+
+class OpenpyxlBook:
+    """openpyxl in write-only mode: rows go straight to temporary sheet files"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._book = openpyxl.Workbook(write_only=True)
+
+    def add_sheet(self, title: str) -> Callable[[tuple], None]:
+        return self._book.create_sheet(title).append
+
+    def close(self):
+        self._book.save(self.path)
+
+
+class XlsxWriterBook:
+    """xlsxwriter in constant-memory mode: each row is flushed once the next one starts"""
+
+    def __init__(self, path: str):
+        self._book = xlsxwriter.Workbook(path, {'constant_memory': True})
+
+    def add_sheet(self, title: str) -> Callable[[tuple], None]:
+        sheet = self._book.add_worksheet(title)
+        row_numbers = itertools.count()
+        return lambda row: sheet.write_row(next(row_numbers), 0, row)
+
+    def close(self):
+        self._book.close()
+
+
+EXCEL_ENGINES = {
+    'xlsxwriter': XlsxWriterBook,
+    'openpyxl': OpenpyxlBook,
+}
+
+AVAILABLE_EXCEL_ENGINES = {
+    'xlsxwriter': XLSXWRITER_AVAILABLE,
+    'openpyxl': True,
+}
+
+
+def _excel_rows(frames: Iterable[pd.DataFrame]) -> Iterator[tuple]:
+    """Row tuples of each chunk, with missing numbers as empty cells"""
+    for frame in frames:
+        columns = []
+        for name in frame.columns:
+            values = frame[name].to_numpy(dtype=object)
+            if frame[name].dtype.kind == 'f':
+                values[np.isnan(frame[name].to_numpy())] = None
+            columns.append(values.tolist())
+        yield from zip(*columns)
+
+
+def _write_sheets(book, title: str, columns, rows: Iterable[tuple], max_rows: int, always: bool = True) -> int:
+    """Write rows under ``title``, starting "<title> 2", "<title> 3"... each time a sheet is full
+
+    Returns the number of sheets written. With ``always`` false, no sheet
+    is added when there are no rows.
+    """
+    sheets = 0
+    append = None
+    sheet_rows = max_rows
+    for row in rows:
+        if sheet_rows == max_rows:
+            sheets += 1
+            append = book.add_sheet(title if sheets == 1 else f"{title} {sheets}")
+            append(columns)
+            sheet_rows = 1
+        append(row)
+        sheet_rows += 1
+    if sheets == 0 and always:
+        book.add_sheet(title)(columns)
+        sheets = 1
+    return sheets
+
+
+def write_excel(results: ResultStore, path: str, engine: Optional[str] = None,
+                max_rows: int = EXCEL_MAX_ROWS):
+    """Summary and Detailed sheets, written row by row from the store's chunks
+
+    Memory stays flat however many rows there are: the writer streams
+    each sheet to disk and only one chunk of rows is materialised at a
+    time. Tables longer than ``max_rows`` continue on numbered sheets.
+    ``engine`` picks the writer (default: the fastest one installed).
+    """
+    if engine is None:
+        engine = next(name for name in EXCEL_ENGINE_PREFERENCE if AVAILABLE_EXCEL_ENGINES[name])
+    if not AVAILABLE_EXCEL_ENGINES.get(engine):
+        raise ValueError(f"Excel writer {engine!r} is not installed")
+    book = EXCEL_ENGINES[engine](path)
+    try:
+        summary = results.iter_summary_frames(EXCEL_CHUNK_ROWS)
+        _write_sheets(book, 'Summary', SUMMARY_COLUMNS, _excel_rows(summary), max_rows)
+        # Detailed sheet: one row per keyword occurrence and advertiser
+        detailed = results.iter_detailed_frames(EXCEL_CHUNK_ROWS)
+        _write_sheets(book, 'Detailed', DETAILED_COLUMNS, _excel_rows(detailed), max_rows, always=False)
+    finally:
+        book.close()
+
+
+def _arrow_batch(frame: pd.DataFrame, schema) -> 'pa.RecordBatch':
+    """A chunk as a record batch; categoricals become plain strings for this chunk only"""
+    return pa.RecordBatch.from_arrays(
+        [pa.array(frame[field.name].to_numpy(), type=field.type) for field in schema],
+        schema=schema,
+    )
+
+
+def _write_arrow(chunks, schema, path: str, file_format: str):
+    """Write each chunk as its own row group (Parquet) or record batch (Arrow IPC file)"""
+    if file_format == 'parquet':
+        writer = pq.ParquetWriter(path, schema)
+    else:
+        writer = pa.ipc.new_file(path, schema)
+    try:
+        for frame in chunks:
+            writer.write_batch(_arrow_batch(frame, schema))
+    finally:
+        writer.close()
+
+
+def write_summary_parquet(results: ResultStore, path: str):
+    _write_arrow(results.iter_summary_frames(), SUMMARY_SCHEMA, path, 'parquet')
+
+
+def write_detailed_parquet(results: ResultStore, path: str):
+    _write_arrow(results.iter_detailed_frames(), DETAILED_SCHEMA, path, 'parquet')
+
+
+def write_summary_arrow(results: ResultStore, path: str):
+    _write_arrow(results.iter_summary_frames(), SUMMARY_SCHEMA, path, 'arrow')
+
+
+def write_detailed_arrow(results: ResultStore, path: str):
+    _write_arrow(results.iter_detailed_frames(), DETAILED_SCHEMA, path, 'arrow')
+
+
+EXCEL_MIME = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Export name -> label, download file name, MIME type and writer
+EXPORTS = {
+    'csv': ("Summary (CSV)", 'keyword_analysis_results.csv', 'text/csv', write_summary_csv),
+    'json': ("Detailed (JSON)", 'keyword_analysis_detailed.json', 'application/json', write_detailed_json),
+    'excel': ("Summary + Detailed (Excel)", 'keyword_analysis_results.xlsx', EXCEL_MIME, write_excel),
+    'failed': ("Failed Keywords (CSV, for a retry run)", 'keyword_analysis_failed.csv', 'text/csv', write_failed_csv),
+    'summary_parquet': ("Summary (Parquet)", 'keyword_analysis_results.parquet',
+                        'application/vnd.apache.parquet', write_summary_parquet),
+    'detailed_parquet': ("Detailed (Parquet)", 'keyword_analysis_detailed.parquet',
+                         'application/vnd.apache.parquet', write_detailed_parquet),
+    'summary_arrow': ("Summary (Arrow IPC)", 'keyword_analysis_results.arrow',
+                      'application/vnd.apache.arrow.file', write_summary_arrow),
+    'detailed_arrow': ("Detailed (Arrow IPC)", 'keyword_analysis_detailed.arrow',
+                       'application/vnd.apache.arrow.file', write_detailed_arrow),
+}
+
+ARROW_EXPORTS = {'summary_parquet', 'detailed_parquet', 'summary_arrow', 'detailed_arrow'}
+
+
+def available_exports() -> Dict[str, tuple]:
+    """The exports that can be written with the installed packages"""
+    return {name: export for name, export in EXPORTS.items() if ARROW_AVAILABLE or name not in ARROW_EXPORTS}
+
+
+def export_path(name: str, directory: str) -> str:
+    return os.path.join(directory, EXPORTS[name][1])
+
+
+def write_export(results: ResultStore, name: str, directory: str) -> str:
+    """Write export ``name`` into ``directory`` unless it is already there; return its path
+
+    The file is written under a temporary name and renamed when complete,
+    so a half-written export is never served.
+    """
+    if name not in available_exports():
+        raise ValueError(f"Export {name!r} is not available")
+    write = EXPORTS[name][3]
+    path = export_path(name, directory)
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        # Keep the extension: some writers pick their format from it
+        root, extension = os.path.splitext(path)
+        tmp_path = f"{root}.tmp-{uuid.uuid4().hex[:8]}{extension}"
+        try:
+            write(results, tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return path
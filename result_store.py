@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+Result Store
+Columnar, array-backed store of analysis results that the results table,
+exports and charts read as views
+"""
+
+import math
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from advertiser_stats import top_n
+
+SUMMARY_COLUMNS = ['data_item', 'main_term', 'qt', 'advertisers', 'ad_count']
+# Same columns as a CSV keyword file, so failed keywords can be uploaded again
+FAILED_COLUMNS = ['main_term', 'keyword', 'country', 'form_factor']
+DETAILED_COLUMNS = ['keyword', 'main_term', 'data_item', 'advertiser', 'relevance_score']
+
+# Task rows per piece when views are read in chunks
+CHUNK_ROWS = 100_000
+
+
+class StringPool:
+    """Interns strings to dense integer IDs"""
+
+    def __init__(self):
+        self.values: List[str] = []
+        self._ids: Dict[str, int] = {}
+        self._index = None
+        self._ranks = None
+
+    def intern(self, value: str) -> int:
+        string_id = self._ids.get(value)
+        if string_id is None:
+            string_id = self._ids[value] = len(self.values)
+            self.values.append(value)
+        return string_id
+
+    def index(self) -> pd.Index:
+        """The values as a pandas Index, rebuilt only after new strings are interned
+
+        Categoricals built over it share it instead of converting the
+        whole pool again, which matters when views are read in chunks.
+        """
+        if self._index is None or len(self._index) != len(self.values):
+            self._index = pd.Index(self.values)
+        return self._index
+
+    def ranks(self) -> np.ndarray:
+        """Each string's position in sorted order, so IDs can be sorted as the strings would be"""
+        if self._ranks is None or len(self._ranks) != len(self.values):
+            order = self.index().argsort()
+            self._ranks = np.empty(len(order), dtype=np.int64)
+            self._ranks[order] = np.arange(len(order))
+        return self._ranks
+
+    def lookup(self, value: str) -> Optional[int]:
+        """ID of an interned string, or None"""
+        return self._ids.get(value)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+def _score(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class ResultStore:
+    """Results of one run, held once in typed arrays
+
+    There is one row per task (in task index order) and one entry per
+    unique query. Rows point at their query, and each query's named ads
+    are a contiguous slice of the ad arrays, so a result shared by many
+    duplicate rows is stored once. Keywords, main terms and advertisers
+    are interned; relevance scores are floats, NaN when missing.
+
+    A row is only visible in the views once its query has results.
+    Running totals over the visible rows (keywords done, keywords with
+    ads, total ads, rows per advertiser and distinct advertisers) are
+    updated as rows and results arrive, at a cost proportional to the
+    query's ads, never to the size of the run. The store is not locked:
+    writers and readers must not overlap.
+    """
+
+    def __init__(self):
+        self.keywords = StringPool()
+        self.main_terms = StringPool()
+        self.advertisers = StringPool()
+        # Comma-joined advertiser names per query, as the summary table shows them
+        self.advertiser_lists = StringPool()
+        self.countries = StringPool()
+        self.form_factors = StringPool()
+
+        self.row_data_item = array('i')
+        self.row_main_term = array('i')
+        self.row_keyword = array('i')
+        self.row_query = array('i')
+        self.keyword_first_row = array('i')
+
+        self.query_done = array('b')
+        self.query_failed = array('b')
+        self.query_country = array('i')
+        self.query_form_factor = array('i')
+        self.query_ad_count = array('i')
+        self.query_advertiser_list = array('i')
+        self.query_ads_start = array('q')
+        self.query_ads_end = array('q')
+        self.query_rows = array('i')
+
+        self.ad_advertiser = array('i')
+        self.ad_score = array('d')
+
+        self.completed_queries = 0
+
+        # Running totals over visible rows
+        self.keywords_done = 0
+        self.keywords_with_ads = 0
+        self.total_ads = 0
+        self.distinct_advertisers = 0
+        self.advertiser_rows = array('q')
+        # Visible rows per ad count, indexed by ad count
+        self.ad_count_rows = array('q')
+
+    def __len__(self) -> int:
+        return len(self.row_query)
+
+    def add_query(self, country_code: str = '', form_factor: str = '') -> int:
+        """Reserve an entry for a query and return its ID"""
+        self.query_done.append(0)
+        self.query_failed.append(0)
+        self.query_country.append(self.countries.intern(country_code))
+        self.query_form_factor.append(self.form_factors.intern(form_factor))
+        self.query_ad_count.append(0)
+        self.query_advertiser_list.append(0)
+        self.query_ads_start.append(0)
+        self.query_ads_end.append(0)
+        self.query_rows.append(0)
+        return len(self.query_done) - 1
+
+    def add_row(self, task: Dict, query_id: int):
+        """Add the row for a task; tasks must arrive in index order"""
+        if task['index'] != len(self.row_query):
+            raise ValueError(f"Expected task {len(self.row_query)}, got task {task['index']}")
+        keyword_id = self.keywords.intern(task['keyword'])
+        if keyword_id == len(self.keyword_first_row):
+            self.keyword_first_row.append(task['index'])
+        self.row_data_item.append(task['data_item'])
+        self.row_main_term.append(self.main_terms.intern(task['main_term']))
+        self.row_keyword.append(keyword_id)
+        self.row_query.append(query_id)
+        self.query_rows[query_id] += 1
+        if self.query_done[query_id]:
+            self._count_rows(query_id, 1)
+
+    def set_ads(self, query_id: int, ads: List[Dict], failed: bool = False):
+        """Record a query's ads; every row pointing at it becomes visible
+
+        A ``failed`` query shows with no ads and is listed by failed_frame().
+        """
+        self.query_failed[query_id] = failed
+        names = []
+        start = len(self.ad_advertiser)
+        for ad in ads:
+            name = ad.get('adv_name', '').strip()
+            if name:
+                names.append(name)
+                advertiser_id = self.advertisers.intern(name)
+                if advertiser_id == len(self.advertiser_rows):
+                    self.advertiser_rows.append(0)
+                self.ad_advertiser.append(advertiser_id)
+                self.ad_score.append(_score(ad.get('keywordMatchingResult', {}).get('relevanceScore', '')))
+        self.query_ads_start[query_id] = start
+        self.query_ads_end[query_id] = len(self.ad_advertiser)
+        self.query_ad_count[query_id] = len(ads)
+        self.query_advertiser_list[query_id] = self.advertiser_lists.intern(",".join(names))
+        if not self.query_done[query_id]:
+            self.query_done[query_id] = 1
+            self.completed_queries += 1
+            self._count_rows(query_id, self.query_rows[query_id])
+
+    def _count_rows(self, query_id: int, rows: int):
+        """Add ``rows`` newly visible rows of a query to the running totals"""
+        if not rows:
+            return
+        ad_count = self.query_ad_count[query_id]
+        self.keywords_done += rows
+        self.total_ads += ad_count * rows
+        if ad_count:
+            self.keywords_with_ads += rows
+        if ad_count >= len(self.ad_count_rows):
+            self.ad_count_rows.extend([0] * (ad_count + 1 - len(self.ad_count_rows)))
+        self.ad_count_rows[ad_count] += rows
+        for ad in range(self.query_ads_start[query_id], self.query_ads_end[query_id]):
+            advertiser_id = self.ad_advertiser[ad]
+            if not self.advertiser_rows[advertiser_id]:
+                self.distinct_advertisers += 1
+            self.advertiser_rows[advertiser_id] += rows
+
+    def top_advertisers(self, n: int = 10) -> List[Tuple[str, int]]:
+        """The ``n`` advertisers on the most visible rows, from the running totals
+
+        Costs a partial selection over the advertisers, not a pass over the rows.
+        """
+        counts = np.frombuffer(self.advertiser_rows, dtype=np.int64)
+        present = top_n(counts, n)
+        return [(self.advertisers.values[advertiser_id], int(counts[advertiser_id])) for advertiser_id in present]
+
+    def ad_count_histogram(self, max_bins: int = 20) -> pd.DataFrame:
+        """Visible rows per ad count, as at most ``max_bins`` bars: 'Ads per Keyword', 'Keywords'
+
+        Read from the running totals, so its cost depends on the largest
+        ad count, not on the number of rows. Counts are grouped into
+        equal ranges ("10-14") when there are more than ``max_bins`` of them.
+        """
+        counts = np.frombuffer(self.ad_count_rows, dtype=np.int64)
+        width = max(1, -(-len(counts) // max_bins))
+        if width > 1:
+            counts = np.bincount(np.arange(len(counts)) // width, weights=counts).astype(np.int64)
+        labels = [str(start) if width == 1 else f"{start}-{start + width - 1}"
+                  for start in range(0, len(counts) * width, width)]
+        return pd.DataFrame({'Ads per Keyword': labels, 'Keywords': counts})
+
+    def completed_rows(self) -> np.ndarray:
+        """Indexes of the rows whose query has results, in task order"""
+        row_query = np.frombuffer(self.row_query, dtype=np.int32)
+        query_done = np.frombuffer(self.query_done, dtype=np.int8).astype(bool)
+        return np.flatnonzero(query_done[row_query])
+
+    def max_ad_count(self) -> int:
+        """Largest ad count of any query with results"""
+        done = np.frombuffer(self.query_done, dtype=np.int8).astype(bool)
+        ad_counts = np.frombuffer(self.query_ad_count, dtype=np.int32)[done]
+        return int(ad_counts.max()) if len(ad_counts) else 0
+
+    def select_rows(self, main_terms: Optional[List[str]] = None, advertiser: str = '',
+                    min_ads: Optional[int] = None, max_ads: Optional[int] = None,
+                    sort_by: Optional[str] = None, descending: bool = False) -> np.ndarray:
+        """Completed rows matching the filters, in display order
+
+        ``advertiser`` keeps rows with an ad from any advertiser whose name
+        contains it (case-insensitive). ``sort_by`` is a summary column;
+        rows otherwise stay in task order. Filtering and sorting run on the
+        integer arrays, touching text once per distinct string, so a page
+        of a large run can be picked without building the whole table.
+        """
+        rows = self.completed_rows()
+        row_query = np.frombuffer(self.row_query, dtype=np.int32)
+        query_ad_count = np.frombuffer(self.query_ad_count, dtype=np.int32)
+
+        if main_terms:
+            term_ids = [self.main_terms.lookup(term) for term in main_terms]
+            term_ids = [term_id for term_id in term_ids if term_id is not None]
+            rows = rows[np.isin(np.frombuffer(self.row_main_term, dtype=np.int32)[rows], term_ids)]
+        if min_ads is not None:
+            rows = rows[query_ad_count[row_query[rows]] >= min_ads]
+        if max_ads is not None:
+            rows = rows[query_ad_count[row_query[rows]] <= max_ads]
+        if advertiser:
+            needle = advertiser.casefold()
+            advertiser_ids = [i for i, name in enumerate(self.advertisers.values) if needle in name.casefold()]
+            matches = np.isin(np.frombuffer(self.ad_advertiser, dtype=np.int32), advertiser_ids)
+            # Matching ads per query, from a running count over each query's slice of the ad arrays
+            matched = np.concatenate(([0], np.cumsum(matches)))
+            query_matches = (matched[np.frombuffer(self.query_ads_end, dtype=np.int64)]
+                             - matched[np.frombuffer(self.query_ads_start, dtype=np.int64)])
+            rows = rows[query_matches[row_query[rows]] > 0]
+
+        if sort_by is not None:
+            if sort_by == 'data_item':
+                key = np.frombuffer(self.row_data_item, dtype=np.int32)[rows]
+            elif sort_by == 'main_term':
+                key = self.main_terms.ranks()[np.frombuffer(self.row_main_term, dtype=np.int32)[rows]]
+            elif sort_by == 'qt':
+                key = self.keywords.ranks()[np.frombuffer(self.row_keyword, dtype=np.int32)[rows]]
+            elif sort_by == 'advertisers':
+                advertiser_list = np.frombuffer(self.query_advertiser_list, dtype=np.int32)
+                key = self.advertiser_lists.ranks()[advertiser_list[row_query[rows]]]
+            elif sort_by == 'ad_count':
+                key = query_ad_count[row_query[rows]]
+            else:
+                raise ValueError(f"Cannot sort by {sort_by!r}")
+            key = key.astype(np.int64)
+            rows = rows[np.argsort(-key if descending else key, kind='stable')]
+        return rows
+
+    def failed_frame(self, rows: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """One row per task whose query failed: main_term, keyword, country, form_factor"""
+        if rows is None:
+            rows = self.failed_rows()
+        queries = np.frombuffer(self.row_query, dtype=np.int32)[rows]
+        return pd.DataFrame({
+            'main_term': pd.Categorical.from_codes(
+                np.frombuffer(self.row_main_term, dtype=np.int32)[rows], self.main_terms.index()),
+            'keyword': pd.Categorical.from_codes(
+                np.frombuffer(self.row_keyword, dtype=np.int32)[rows], self.keywords.index()),
+            'country': pd.Categorical.from_codes(
+                np.frombuffer(self.query_country, dtype=np.int32)[queries], self.countries.index()),
+            'form_factor': pd.Categorical.from_codes(
+                np.frombuffer(self.query_form_factor, dtype=np.int32)[queries], self.form_factors.index()),
+        }, columns=FAILED_COLUMNS)
+
+    def failed_rows(self) -> np.ndarray:
+        """Indexes of the rows whose query failed, in task order"""
+        query_failed = np.frombuffer(self.query_failed, dtype=np.int8).astype(bool)
+        return np.flatnonzero(query_failed[np.frombuffer(self.row_query, dtype=np.int32)])
+
+    def iter_failed_frames(self, chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+        """The failed frame in pieces of at most ``chunk_rows`` rows"""
+        rows = self.failed_rows()
+        for start in range(0, len(rows), chunk_rows):
+            yield self.failed_frame(rows[start:start + chunk_rows])
+
+    def keyword_ordered_rows(self) -> np.ndarray:
+        """Completed rows grouped by keyword, in the order keywords first appear"""
+        rows = self.completed_rows()
+        keyword_first_row = np.frombuffer(self.keyword_first_row, dtype=np.int32)
+        row_keyword = np.frombuffer(self.row_keyword, dtype=np.int32)
+        return rows[np.argsort(keyword_first_row[row_keyword[rows]], kind='stable')]
+
+    def summary_frame(self, rows: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """One row per completed task: data_item, main_term, qt, advertisers, ad_count
+
+        Text columns are categoricals over the interned strings, so
+        building the frame copies integer codes, not strings. ``rows``
+        limits the frame to those rows (default: every completed row).
+        """
+        if rows is None:
+            rows = self.completed_rows()
+        queries = np.frombuffer(self.row_query, dtype=np.int32)[rows]
+        return pd.DataFrame({
+            'data_item': np.frombuffer(self.row_data_item, dtype=np.int32)[rows],
+            'main_term': pd.Categorical.from_codes(
+                np.frombuffer(self.row_main_term, dtype=np.int32)[rows], self.main_terms.index()),
+            'qt': pd.Categorical.from_codes(
+                np.frombuffer(self.row_keyword, dtype=np.int32)[rows], self.keywords.index()),
+            'advertisers': pd.Categorical.from_codes(
+                np.frombuffer(self.query_advertiser_list, dtype=np.int32)[queries], self.advertiser_lists.index()),
+            'ad_count': np.frombuffer(self.query_ad_count, dtype=np.int32)[queries],
+        }, columns=SUMMARY_COLUMNS)
+
+    def _detailed_rows(self, rows: np.ndarray):
+        """(row, ad) index pairs for every named ad of ``rows``, in row order"""
+        queries = np.frombuffer(self.row_query, dtype=np.int32)[rows]
+        starts = np.frombuffer(self.query_ads_start, dtype=np.int64)[queries]
+        counts = np.frombuffer(self.query_ads_end, dtype=np.int64)[queries] - starts
+        ad_rows = np.repeat(rows, counts)
+        # Each row's ads run from its query's start; shift a global counter to match
+        offsets = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        ads = offsets + np.arange(len(ad_rows), dtype=np.int64)
+        return ad_rows, ads
+
+    def detailed_frame(self, rows: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """One row per (completed task, named ad): keyword, main_term, data_item, advertiser, relevance_score
+
+        ``rows`` limits the frame to those rows (default: every completed
+        row, grouped by keyword).
+        """
+        if rows is None:
+            rows = self.keyword_ordered_rows()
+        ad_rows, ads = self._detailed_rows(rows)
+        return pd.DataFrame({
+            'keyword': pd.Categorical.from_codes(
+                np.frombuffer(self.row_keyword, dtype=np.int32)[ad_rows], self.keywords.index()),
+            'main_term': pd.Categorical.from_codes(
+                np.frombuffer(self.row_main_term, dtype=np.int32)[ad_rows], self.main_terms.index()),
+            'data_item': np.frombuffer(self.row_data_item, dtype=np.int32)[ad_rows],
+            'advertiser': pd.Categorical.from_codes(
+                np.frombuffer(self.ad_advertiser, dtype=np.int32)[ads], self.advertisers.index()),
+            'relevance_score': np.frombuffer(self.ad_score, dtype=np.float64)[ads],
+        }, columns=DETAILED_COLUMNS)
+
+    def iter_summary_frames(self, chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+        """The summary frame in pieces of at most ``chunk_rows`` rows"""
+        rows = self.completed_rows()
+        for start in range(0, len(rows), chunk_rows):
+            yield self.summary_frame(rows[start:start + chunk_rows])
+
+    def iter_detailed_frames(self, chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+        """The detailed frame in pieces covering ``chunk_rows`` task rows each"""
+        rows = self.keyword_ordered_rows()
+        for start in range(0, len(rows), chunk_rows):
+            yield self.detailed_frame(rows[start:start + chunk_rows])
+
+    def iter_detailed(self) -> Iterator[Tuple[str, Dict]]:
+        """(keyword, details and occurrences) pairs, in the layout of the JSON export
+
+        Details come from the keyword's first completed row; every
+        completed row with that keyword is listed as an occurrence. Only
+        one keyword's entry is built at a time.
+        """
+        keyword_id = None
+        entry = None
+        for row in self.keyword_ordered_rows().tolist():
+            occurrence = {
+                'data_item': self.row_data_item[row],
+                'main_term': self.main_terms.values[self.row_main_term[row]],
+            }
+            if self.row_keyword[row] == keyword_id:
+                entry['occurrences'].append(occurrence)
+                continue
+            if entry is not None:
+                yield self.keywords.values[keyword_id], entry
+            keyword_id = self.row_keyword[row]
+            query = self.row_query[row]
+            details = [
+                {
+                    'advertiser_name': self.advertisers.values[self.ad_advertiser[ad]],
+                    'relevance_score': '' if math.isnan(self.ad_score[ad]) else self.ad_score[ad],
+                }
+                for ad in range(self.query_ads_start[query], self.query_ads_end[query])
+            ]
+            entry = dict(occurrence, details=details, occurrences=[occurrence])
+        if entry is not None:
+            yield self.keywords.values[keyword_id], entry
+
+    def detailed_dict(self) -> Dict:
+        """Keyword -> details and occurrences, in the layout of the JSON export"""
+        return dict(self.iter_detailed())
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Result Writers
+Stream result rows to CSV, JSONL or Parquet files as they arrive
+"""
+
+import csv
+import json
+import os
+import shutil
+from typing import Dict, List
+
+# Optional Parquet support
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+SUMMARY_COLUMNS = ['data_item', 'main_term', 'qt', 'advertisers', 'ad_count', 'error']
+
+# Columns stored as integers in typed formats; everything else is text
+INTEGER_COLUMNS = {'data_item', 'ad_count'}
+
+OUTPUT_FORMATS = {
+    '.csv': 'csv',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.parquet': 'parquet',
+}
+
+# Rows buffered per Parquet row group
+PARQUET_BATCH_ROWS = 10000
+
+
+class CSVResultWriter:
+    """Writes rows to a CSV file, one line per row"""
+
+    def __init__(self, path: str, columns: List[str]):
+        self.rows = 0
+        self._file = open(path, 'w', encoding='utf-8', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=columns, extrasaction='ignore')
+        self._writer.writeheader()
+
+    def write(self, row: Dict):
+        self._writer.writerow(row)
+        self.rows += 1
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class JSONLResultWriter:
+    """Writes rows to a JSON Lines file, one object per line"""
+
+    def __init__(self, path: str, columns: List[str]):
+        self.rows = 0
+        self.columns = columns
+        self._file = open(path, 'w', encoding='utf-8')
+
+    def write(self, row: Dict):
+        record = {column: row.get(column) for column in self.columns}
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+        self.rows += 1
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ParquetResultWriter:
+    """Writes rows to a Parquet file, one row group per batch of rows"""
+
+    def __init__(self, path: str, columns: List[str], batch_rows: int = PARQUET_BATCH_ROWS):
+        if not PARQUET_AVAILABLE:
+            raise RuntimeError("Parquet output requires pyarrow (pip install pyarrow)")
+        self.rows = 0
+        self.columns = columns
+        self.batch_rows = batch_rows
+        self._batch = []
+        self._schema = pa.schema([
+            (column, pa.int64() if column in INTEGER_COLUMNS else pa.string()) for column in columns
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write(self, row: Dict):
+        self._batch.append(row)
+        self.rows += 1
+        if len(self._batch) >= self.batch_rows:
+            self._flush()
+
+    def _flush(self):
+        table = pa.Table.from_pylist(self._batch, schema=self._schema)
+        self._writer.write_table(table)
+        self._batch = []
+
+    def close(self):
+        if self._batch:
+            self._flush()
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+WRITERS = {
+    'csv': CSVResultWriter,
+    'jsonl': JSONLResultWriter,
+    'parquet': ParquetResultWriter,
+}
+
+
+def detect_format(path: str) -> str:
+    """Guess the output format from a file extension"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in OUTPUT_FORMATS:
+        raise ValueError(f"Cannot tell the output format of {path}; use .csv, .jsonl or .parquet")
+    return OUTPUT_FORMATS[extension]
+
+
+def create_result_writer(path: str, output_format: str = None, columns: List[str] = SUMMARY_COLUMNS):
+    """Create a streaming writer for ``path``, guessing the format from its extension"""
+    return WRITERS[output_format or detect_format(path)](path, columns)
+
+
+def concat_result_files(part_paths: List[str], path: str, output_format: str):
+    """Join part files written by separate workers into one file, in order
+
+    Parts are copied block by block (CSV headers after the first are
+    skipped, Parquet row groups are copied as they are), so nothing is
+    re-sorted or held in memory as a whole.
+    """
+    if output_format == 'parquet':
+        writer = None
+        for part_path in part_paths:
+            part = pq.ParquetFile(part_path)
+            if writer is None:
+                writer = pq.ParquetWriter(path, part.schema_arrow)
+            for group in range(part.num_row_groups):
+                writer.write_table(part.read_row_group(group))
+        if writer is not None:
+            writer.close()
+        return
+
+    with open(path, 'wb') as output:
+        for i, part_path in enumerate(part_paths):
+            with open(part_path, 'rb') as part:
+                if output_format == 'csv' and i > 0:
+                    part.readline()
+                shutil.copyfileobj(part, output)
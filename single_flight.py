@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Single Flight
+Coalesces concurrent identical ISP queries into one in-flight request
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class _LeaderCancelled(Exception):
+    """Handed to followers when the leader's caller was cancelled before a result came in"""
+
+
+class SingleFlight:
+    """Lets concurrent callers for the same key share one request
+
+    The first caller for a key (the leader) runs the request; anyone who
+    asks for the same key before it finishes waits for the leader's result
+    instead of issuing their own. Results are shared through a thread-safe
+    future, so callers may live on different threads and event loops,
+    e.g. one fetch engine per Streamlit session. If the leader is
+    cancelled (its job was stopped), its followers ask again and one of
+    them leads a new request, so one session's cancel never fails another's.
+    """
+
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Run ``call`` once per in-flight key; return (result, was_coalesced)"""
+        while True:
+            with self._lock:
+                future = self._calls.get(key)
+                if future is None:
+                    future = self._calls[key] = concurrent.futures.Future()
+                    self.leaders += 1
+                    leader = True
+                else:
+                    leader = False
+
+            if leader:
+                break
+            try:
+                # Shield so a cancelled follower cannot cancel the shared future
+                result = await asyncio.shield(asyncio.wrap_future(future))
+            except _LeaderCancelled:
+                continue
+            # Counted only once a shared result is actually returned
+            with self._lock:
+                self.coalesced += 1
+            return result, True
+
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            self._finish(key, future, exception=_LeaderCancelled())
+            raise
+        except BaseException as e:
+            self._finish(key, future, exception=e)
+            raise
+        self._finish(key, future, result=result)
+        return result, False
+
+    def _finish(self, key: Hashable, future: concurrent.futures.Future, result: Any = None,
+                exception: Optional[BaseException] = None):
+        """Hand the outcome to the followers, after the key is free for a new leader"""
+        with self._lock:
+            del self._calls[key]
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def stats(self) -> Dict:
+        """Process-wide leader / coalesced counts"""
+        with self._lock:
+            return {
+                'leaders': self.leaders,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._calls),
+            }
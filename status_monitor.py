@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Status Monitor
+Runs slow status checks (VPN, network, API reachability) on a background
+thread and serves the latest snapshot without waiting for them
+"""
+
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+# Seconds a snapshot is served before the next read starts a refresh
+STATUS_TTL_SECONDS = 30
+
+
+class StatusMonitor:
+    """Latest result of a slow ``collect()`` call, refreshed in the background
+
+    Only the very first read waits for ``collect()``. Once the snapshot is
+    older than ``ttl``, the next read starts a refresh on a background
+    thread and keeps getting the old snapshot until it is done. Meant to
+    be held once per server process (e.g. via st.cache_resource), so all
+    sessions and reruns share one refresh.
+    """
+
+    def __init__(self, collect: Callable[[], Dict], ttl: float = STATUS_TTL_SECONDS):
+        self.collect = collect
+        self.ttl = ttl
+        self.error = None
+        self._snapshot = None
+        self._collected_at = 0.0
+        # Set when the running refresh finishes; None while idle
+        self._refreshing = None
+        self._again = False
+        self._lock = threading.Lock()
+
+    @property
+    def age(self) -> Optional[float]:
+        """Seconds since the current snapshot was collected"""
+        with self._lock:
+            return time.monotonic() - self._collected_at if self._snapshot is not None else None
+
+    def snapshot(self) -> Dict:
+        """The latest snapshot, starting a background refresh if it has expired"""
+        with self._lock:
+            done = None
+            if self._snapshot is None or time.monotonic() - self._collected_at >= self.ttl:
+                done = self._start_refresh()
+            snapshot = self._snapshot
+        if snapshot is None:
+            done.wait()
+            with self._lock:
+                snapshot = self._snapshot
+            if snapshot is None:
+                raise RuntimeError(f"Status check failed: {self.error}")
+        return snapshot
+
+    def refresh(self, wait: bool = False):
+        """Collect again now, e.g. after connecting a VPN, optionally waiting for the result
+
+        A refresh already running is followed by one more, so the result
+        always reflects changes made before this call.
+        """
+        with self._lock:
+            if self._refreshing is not None:
+                self._again = True
+            done = self._start_refresh()
+        if wait:
+            done.wait()
+
+    def _start_refresh(self) -> threading.Event:
+        """Start a refresh unless one is running; call with the lock held"""
+        if self._refreshing is None:
+            self._refreshing = threading.Event()
+            threading.Thread(target=self._run, daemon=True).start()
+        return self._refreshing
+
+    def _run(self):
+        while True:
+            try:
+                snapshot = self.collect()
+                error = None
+            except Exception as e:
+                snapshot = None
+                error = str(e)
+            with self._lock:
+                if snapshot is not None:
+                    self._snapshot = snapshot
+                # A failed check is not retried until the snapshot expires again
+                self._collected_at = time.monotonic()
+                self.error = error
+                if self._again:
+                    self._again = False
+                    continue
+                done = self._refreshing
+                self._refreshing = None
+            done.set()
+            return
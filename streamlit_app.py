@@ -1,17 +1,24 @@
 import streamlit as st
-import json
 import requests
 import time
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 import io
 import base64
 import socket
 
+from fetch_engine import API_URL_TEMPLATE, HEADERS
+from job_journal import create_job, delete_job, list_jobs, open_job, prune_jobs
+from job_runner import AnalysisJob, JobRunner
+from keyword_input import InvalidInputError, detect_input_format, scan_input
+from rate_limiter import TokenBucket
+from response_cache import create_memory_cache, create_response_cache
+from result_exports import ARROW_AVAILABLE, available_exports
+from result_store import SUMMARY_COLUMNS
+from single_flight import SingleFlight
+from status_monitor import StatusMonitor
+
 # Import VPN manager
 try:
     from vpn_manager import create_vpn_manager
@@ -19,6 +26,25 @@ try:
 except ImportError:
     VPN_MANAGER_AVAILABLE = False
 
+# Rows per page offered by the results table
+TABLE_PAGE_SIZES = [50, 100, 250, 1000]
+
+# Labels for FetchError categories in the error summary
+ERROR_CATEGORIES = {
+    'connection': "🔌 Connection",
+    'timeout': "⏰ Timeout",
+    'http': "🌐 HTTP",
+    'decode': "🧩 Decode",
+    'other': "❓ Other",
+}
+
+# Seconds between redraws of a running job's progress panel
+PROGRESS_REFRESH_SECONDS = 0.25
+
+# st.fragment (Streamlit 1.37+) redraws the progress panel on its own timer;
+# older versions fall back to rerunning the whole page
+fragment = getattr(st, 'fragment', None)
+
 # Page configuration
 st.set_page_config(
     page_title="Keyword Ad Analysis Tool",
@@ -80,19 +106,6 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# API endpoint template
-API_URL_TEMPLATE = (
-    'http://prod-ssp-engine-private.ric1.admarketplace.net/isp'
-    '?plid=cjqduwisj4&results-ta=100&qt={}&country-code={}'
-    '&region-code=&form-factor={}&os-family=windows'
-    '&v=2.0&out=json&diag=enabled&ctaid='
-)
-
-HEADERS = {
-    'User-Agent': 'Mozilla/5.0',
-    'Accept': 'application/json'
-}
-
 def check_vpn_connectivity():
     """Check if VPN connection is available by testing connectivity to the API server"""
     try:
@@ -156,71 +169,310 @@ def check_vpn_with_retry(max_retries=3):
     
     return False, "❌ VPN connection check failed after multiple attempts"
 
-def create_session():
-    """Create a requests session with connection pooling and retry logic"""
-    session = requests.Session()
-    
-    retry_strategy = Retry(
-        total=3,
-        backoff_factor=1,
-        status_forcelist=[429, 500, 502, 503, 504],
+def check_connectivity():
+    """VPN reachability and, once that works, the API endpoint, as one status snapshot"""
+    vpn_status, vpn_message = check_vpn_with_retry()
+    api_status, api_message = test_api_endpoint() if vpn_status else (False, "")
+    return {
+        'vpn_status': vpn_status,
+        'vpn_message': vpn_message,
+        'api_status': api_status,
+        'api_message': api_message,
+    }
+
+@st.cache_resource
+def get_connectivity_monitor():
+    """VPN and API checks, refreshed in the background so reruns never wait on them"""
+    return StatusMonitor(check_connectivity)
+
+@st.cache_resource
+def get_vpn_monitor():
+    """VPN connections and network info, refreshed in the background so reruns never shell out"""
+    return StatusMonitor(create_vpn_manager().collect_status)
+
+@st.cache_resource
+def get_shared_memory_cache():
+    """In-memory LRU shared by every session on this Streamlit server"""
+    return create_memory_cache()
+
+@st.cache_resource
+def get_single_flight():
+    """Coalesces identical in-flight queries across every session on this server"""
+    return SingleFlight()
+
+@st.cache_resource
+def get_rate_limiter():
+    """One request budget for every job on this server, whichever session started it"""
+    return TokenBucket(10)
+
+@st.cache_resource
+def get_job_runner():
+    """Background job runner owned by the server process"""
+    return JobRunner()
+
+def summarize_input(file_key, input_file, input_format, country_code, form_factor, reopen_input):
+    """Preview the start of an input file once per session; reruns reuse its summary"""
+    summaries = st.session_state.setdefault('input_summaries', {})
+    key = (file_key, input_format, country_code, form_factor)
+    if key not in summaries:
+        summaries.clear()
+        input_file.seek(0)
+        summaries[key] = scan_input(input_file, input_format, country_code, form_factor, reopen_input)
+    return summaries[key]
+
+def render_concurrency_status(snapshot):
+    """Show the adaptive controller's current and target concurrency"""
+    p95 = f"{snapshot['p95_ms']} ms" if snapshot['p95_ms'] is not None else "n/a"
+    st.markdown(
+        f"⚙️ **Concurrency:** {snapshot['in_flight']} in flight · "
+        f"target {snapshot['limit']} (max {snapshot['max_limit']}) · p95 latency {p95}"
     )
+
+def render_error_summary(progress):
+    """Failures counted by category and HTTP status, with sample keywords, in one table"""
+    error_df = pd.DataFrame([
+        {
+            'Category': ERROR_CATEGORIES.get(entry['category'], entry['category']),
+            'HTTP Status': str(entry['status']) if entry['status'] is not None else '',
+            'Count': entry['count'],
+            'Sample Keywords': ", ".join(entry['samples']),
+            'Last Message': entry['last_message'],
+        }
+        for entry in progress['error_counts']
+    ])
+    st.dataframe(error_df.sort_values('Count', ascending=False), use_container_width=True, hide_index=True)
+
+def render_skipped_input(progress):
+    """Main terms and data items the job skipped while reading its input"""
+    if not progress['skipped_count']:
+        return
+    with st.expander(f"⚠️ {progress['skipped_count']} skipped main terms or data items"):
+        for note in progress['skipped']:
+            st.write(f"{note}, skipping...")
+        hidden_notes = progress['skipped_count'] - len(progress['skipped'])
+        if hidden_notes:
+            st.caption(f"...and {hidden_notes} more")
+
+def render_job_progress(progress):
+    """Show progress for a queued or running job"""
+    if progress['status'] == 'queued':
+        st.info(f"⏳ Job {progress['job_id']} is queued behind other analyses...")
+        return
     
-    adapter = HTTPAdapter(
-        max_retries=retry_strategy,
-        pool_connections=10,
-        pool_maxsize=10
+    pending = progress['pending']
+    overall_progress = progress['processed'] / pending if pending else 0.0
+    st.progress(overall_progress)
+    st.text(
+        f"📊 Progress: {progress['processed']}/{pending}{'' if progress['input_done'] else '+'} "
+        f"({overall_progress*100:.1f}%) - {progress['elapsed']:.0f}s elapsed - last: {progress['last_keyword']}"
     )
+    if not progress['input_done']:
+        st.write(f"📖 Still reading the input file - {progress['total_tasks']} keywords so far")
+    if progress['reloaded']:
+        st.write(f"♻️ Reloaded {progress['reloaded']} completed queries from the job journal")
+    render_skipped_input(progress)
     
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
-    
-    return session
+    # Partial results from the job's running totals
+    live = progress['live']
+    if live['keywords_done']:
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Keywords Done", live['keywords_done'])
+        with col2:
+            st.metric("Keywords with Ads", live['keywords_with_ads'])
+        with col3:
+            st.metric("Total Ads Found", live['total_ads'])
+        with col4:
+            st.metric("Unique Advertisers", live['distinct_advertisers'])
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            if live['top_advertisers']:
+                advertiser_df = pd.DataFrame(live['top_advertisers'], columns=['Advertiser', 'Count'])
+                fig = px.bar(advertiser_df, x='Advertiser', y='Count', title="Top 10 Advertisers So Far")
+                st.plotly_chart(fig, use_container_width=True)
+        with col2:
+            st.write("**Latest Results**")
+            st.dataframe(pd.DataFrame(live['recent_results']), use_container_width=True, hide_index=True)
+    if progress['controller'] is not None:
+        render_concurrency_status(progress['controller'])
+    if progress['failed']:
+        st.warning(f"⚠️ {progress['failed']} failed queries")
+        render_error_summary(progress)
 
-def fetch_ads(keyword, country_code, form_factor, session):
-    """Fetch ads for a single keyword"""
-    url = API_URL_TEMPLATE.format(keyword, country_code, form_factor)
-    try:
-        response = session.get(url, headers=HEADERS, timeout=30)
-        response.raise_for_status()
-        data = response.json()
-        return data.get('text_ads', [])
-    except requests.exceptions.ConnectionError:
-        st.error(f'❌ Connection failed for "{keyword}" - Please ensure you are connected to the required VPN')
-        return []
-    except requests.exceptions.Timeout:
-        st.error(f'⏰ Request timeout for "{keyword}" - Please check your VPN connection')
-        return []
-    except Exception as e:
-        st.error(f'Failed for "{keyword}": {e}')
-        return []
+def render_active_job(job):
+    """Progress panel for a queued or running job, drawn from one progress snapshot per tick
 
-def process_keyword_batch(keyword_batch, country_code, form_factor, session, progress_bar, status_text):
-    """Process a batch of keywords concurrently"""
-    results = {}
-    
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        future_to_keyword = {
-            executor.submit(fetch_ads, keyword, country_code, form_factor, session): keyword
-            for keyword in keyword_batch
-        }
-        
-        for i, future in enumerate(as_completed(future_to_keyword)):
-            keyword = future_to_keyword[future]
-            try:
-                ads = future.result()
-                results[keyword] = ads
-                status_text.text(f"✅ Completed: {keyword} ({len(ads)} ads)")
-            except Exception as e:
-                st.error(f"Error processing {keyword}: {e}")
-                results[keyword] = []
-            
-            # Update progress
-            progress = (i + 1) / len(keyword_batch)
-            progress_bar.progress(progress)
-            time.sleep(0.1)  # Small delay to be respectful to API
+    The job's threads never call st.*: they update the job's state, and
+    this panel reads it at a fixed rate however fast results arrive.
+    """
+    progress = job.progress()
+    if progress['status'] not in ('queued', 'running'):
+        # Finished since the last tick: redraw the page to show its results
+        st.rerun()
+    render_job_progress(progress)
+
+if fragment is not None:
+    render_active_job = fragment(run_every=PROGRESS_REFRESH_SECONDS)(render_active_job)
+
+def render_results_table(job):
+    """Results table filtered, sorted and paged on the server; only one page goes to the browser"""
+    results = job.results
+    max_ads = results.max_ad_count()
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        main_terms = st.multiselect("Main term", results.main_terms.values, key=f"table_terms_{job.job_id}")
+    with col2:
+        advertiser = st.text_input("Advertiser contains", key=f"table_advertiser_{job.job_id}")
+    with col3:
+        if max_ads > 0:
+            min_count, max_count = st.slider("Ads per keyword", 0, max_ads, (0, max_ads),
+                                             key=f"table_ads_{job.job_id}")
+        else:
+            min_count, max_count = None, None
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        sort_by = st.selectbox("Sort by", [None] + SUMMARY_COLUMNS,
+                               format_func=lambda column: "Input order" if column is None else column,
+                               key=f"table_sort_{job.job_id}")
+    with col2:
+        descending = st.checkbox("Descending", key=f"table_descending_{job.job_id}")
+    with col3:
+        page_size = st.selectbox("Rows per page", TABLE_PAGE_SIZES, key=f"table_page_size_{job.job_id}")
     
-    return results
+    rows = results.select_rows(main_terms, advertiser.strip(), min_count, max_count, sort_by, descending)
+    pages = max(1, -(-len(rows) // page_size))
+    page_key = f"table_page_{job.job_id}"
+    if st.session_state.get(page_key, 1) > pages:
+        st.session_state[page_key] = 1
+    page = st.number_input(f"Page (of {pages:,})", min_value=1, max_value=pages, step=1, key=page_key)
+    
+    start = (page - 1) * page_size
+    page_rows = rows[start:start + page_size]
+    page_df = results.summary_frame(page_rows)
+    page_df.index = range(start + 1, start + 1 + len(page_rows))
+    st.dataframe(page_df, use_container_width=True)
+    st.caption(f"Rows {start + 1 if len(page_rows) else 0:,}-{start + len(page_rows):,} of "
+               f"{len(rows):,} matching ({results.keywords_done:,} in total)")
+
+def render_results(job):
+    """Show metrics, charts and exports for a finished job"""
+    progress = job.progress()
+    if progress['status'] == 'completed':
+        st.success(f"✅ Analysis completed in {progress['elapsed']:.0f}s!")
+    elif progress['status'] == 'cancelled':
+        st.warning("⏹️ Analysis cancelled - partial results below")
+    else:
+        st.error(f"❌ Analysis failed: {progress['error']}")
+    
+    if progress['failed']:
+        st.warning(f"⚠️ {progress['failed']} queries failed - select job {job.job_id} under Resume Job "
+                   f"to retry them, or export Failed Keywords below for a separate retry run")
+        render_error_summary(progress)
+    render_skipped_input(progress)
+    
+    if progress['controller'] is not None:
+        render_concurrency_status(progress['controller'])
+        decisions = progress['controller']['decisions']
+        if decisions:
+            with st.expander("⚙️ Adaptive Concurrency Decisions"):
+                st.dataframe(pd.DataFrame(decisions), use_container_width=True)
+    
+    results = job.results
+    if not results.completed_queries:
+        return
+    
+    # Metrics come from the result store's running totals; no table is built for them
+    request_stats = job.request_stats
+    queries = job.queries
+    duplicate_ratio = 1 - len(job.queries) / job.total_tasks if job.total_tasks else 0.0
+    
+    # Display results
+    st.header("📊 Results")
+    
+    # Metrics
+    col1, col2, col3, col4, col5 = st.columns(5)
+    with col1:
+        st.metric("Total Keywords", results.keywords_done)
+    with col2:
+        st.metric("Keywords with Ads", results.keywords_with_ads)
+    with col3:
+        st.metric("Total Ads Found", results.total_ads)
+    with col4:
+        st.metric("Unique Advertisers", results.distinct_advertisers)
+    with col5:
+        st.metric("Unique Queries", len(queries),
+                  delta=f"{duplicate_ratio*100:.1f}% duplicates saved", delta_color="off",
+                  help="Keyword rows that repeated an earlier query reused its result instead of being re-queried")
+    
+    col1, col2, col3, col4, col5 = st.columns(5)
+    with col1:
+        st.metric("Memory Cache Hits", request_stats['memory_hits'])
+    with col2:
+        st.metric("Disk Cache Hits", request_stats['disk_hits'])
+    with col3:
+        st.metric("Coalesced Requests", request_stats['coalesced'],
+                  help="Queries that joined an identical request already in flight")
+    with col4:
+        st.metric("API Calls", request_stats['api_calls'])
+    with col5:
+        served = request_stats['memory_hits'] + request_stats['disk_hits'] + request_stats['coalesced']
+        st.metric("Served Without API Call", f"{served / len(queries) * 100:.1f}%" if queries else "n/a")
+    
+    # Results table
+    st.subheader("📋 Results Table")
+    render_results_table(job)
+    
+    with st.expander("📑 Breakdown by Main Term"):
+        st.dataframe(job.main_term_breakdown(), use_container_width=True)
+    
+    # Charts
+    col1, col2 = st.columns(2)
+    
+    # Chart inputs come pre-aggregated from the store's running totals, so
+    # figures carry a few dozen points whatever the size of the run
+    with col1:
+        # Advertiser distribution
+        top = results.top_advertisers(10)
+        if top:
+            advertiser_df = pd.DataFrame(top, columns=['Advertiser', 'Count'])
+            fig = px.bar(advertiser_df, x='Advertiser', y='Count', 
+                        title="Top 10 Advertisers")
+            st.plotly_chart(fig, use_container_width=True)
+    
+    with col2:
+        # Ads per keyword distribution
+        if results.keywords_done:
+            fig = px.bar(results.ad_count_histogram(20), x='Ads per Keyword', y='Keywords', 
+                        title="Distribution of Ads per Keyword")
+            st.plotly_chart(fig, use_container_width=True)
+    
+    # Export options: each file is written from the result store in chunks,
+    # only when asked for, and kept with the job for later downloads
+    st.header("💾 Export Results")
+    
+    exports = available_exports()
+    export_name = st.selectbox("Export", list(exports), format_func=lambda name: exports[name][0],
+                               key=f"export_{job.job_id}")
+    label, file_name, mime, _ = exports[export_name]
+    if not ARROW_AVAILABLE:
+        st.caption("Install pyarrow for Parquet and Arrow IPC exports")
+    
+    export_file = job.prepared_export(export_name)
+    if export_file is None and st.button("📦 Prepare Export", key=f"prepare_{job.job_id}"):
+        with st.spinner(f"Writing {label}..."):
+            export_file = job.export(export_name)
+    
+    if export_file is not None:
+        with open(export_file, 'rb') as f:
+            st.download_button(
+                label=f"📄 Download {label}",
+                data=f,
+                file_name=file_name,
+                mime=mime
+            )
 
 def main():
     # Header
@@ -230,8 +482,9 @@ def main():
     if VPN_MANAGER_AVAILABLE:
         st.subheader("🔧 VPN Connection Manager")
         
-        # Initialize VPN manager
+        # Initialize VPN manager; connection and network state come from the background monitor
         vpn_manager = create_vpn_manager()
+        vpn_monitor = get_vpn_monitor()
         
         # Get system info
         system_info = vpn_manager.get_system_info()
@@ -258,7 +511,10 @@ def main():
             
             # List VPN connections
             with st.spinner("Scanning for VPN connections..."):
-                vpn_connections = vpn_manager.list_vpn_connections()
+                vpn_snapshot = vpn_monitor.snapshot()
+            vpn_connections = vpn_snapshot['connections']
+            st.caption(f"Last scanned {vpn_monitor.age:.0f}s ago - rescanned in the background "
+                       f"every {vpn_monitor.ttl:.0f}s")
             
             if vpn_connections:
                 st.write(f"Found {len(vpn_connections)} VPN connection(s):")
@@ -275,6 +531,8 @@ def main():
                                         success, message = vpn_manager.disconnect_vpn(conn['name'])
                                         if success:
                                             st.success(message)
+                                            vpn_monitor.refresh(wait=True)
+                                            get_connectivity_monitor().refresh()
                                             st.rerun()
                                         else:
                                             st.error(message)
@@ -285,14 +543,15 @@ def main():
                                         success, message = vpn_manager.connect_vpn(conn['name'])
                                         if success:
                                             st.success(message)
+                                            vpn_monitor.refresh(wait=True)
+                                            get_connectivity_monitor().refresh()
                                             st.rerun()
                                         else:
                                             st.error(message)
                         
                         with col2:
-                            # Get detailed status
-                            status, status_msg = vpn_manager.get_vpn_status(conn['name'])
-                            st.write(f"**Status:** {status_msg}")
+                            # Detailed status from the same scan
+                            st.write(f"**Status:** {conn['status_message']}")
             else:
                 st.warning("No VPN connections found. Please configure VPN connections in your system settings.")
         
@@ -304,8 +563,7 @@ def main():
             </div>
             """, unsafe_allow_html=True)
             
-            with st.spinner("Gathering network information..."):
-                network_info = vpn_manager.get_network_info()
+            network_info = vpn_snapshot['network_info']
             
             # Display network interfaces
             st.subheader("Network Interfaces")
@@ -352,7 +610,6 @@ def main():
             
             # Display VPN connections status
             st.subheader("VPN Connections Status")
-            vpn_connections = vpn_manager.list_vpn_connections()
             if vpn_connections:
                 for conn in vpn_connections:
                     status_icon = "✅" if conn['status'] == 'Connected' else "❌"
@@ -362,6 +619,7 @@ def main():
     
     # VPN Connectivity Check
     st.subheader("🔒 VPN Connection Status")
+    connectivity_monitor = get_connectivity_monitor()
     
     # Add manual refresh button
     col1, col2 = st.columns([3, 1])
@@ -369,11 +627,16 @@ def main():
         st.write("Click the button to manually check VPN status:")
     with col2:
         if st.button("🔄 Refresh VPN Status", type="secondary"):
-            st.rerun()
+            with st.spinner("Checking VPN connection..."):
+                connectivity_monitor.refresh(wait=True)
     
-    # Check VPN connectivity
+    # VPN and API status from the latest background check
     with st.spinner("Checking VPN connection..."):
-        vpn_status, vpn_message = check_vpn_with_retry()
+        connectivity = connectivity_monitor.snapshot()
+    vpn_status, vpn_message = connectivity['vpn_status'], connectivity['vpn_message']
+    api_status, api_message = connectivity['api_status'], connectivity['api_message']
+    st.caption(f"Last checked {connectivity_monitor.age:.0f}s ago - rechecked in the background "
+               f"every {connectivity_monitor.ttl:.0f}s")
     
     if vpn_status:
         st.markdown(f"""
@@ -383,10 +646,6 @@ def main():
         </div>
         """, unsafe_allow_html=True)
         
-        # Test API endpoint
-        with st.spinner("Testing API endpoint..."):
-            api_status, api_message = test_api_endpoint()
-        
         if api_status:
             st.markdown(f"""
             <div class="vpn-success">
@@ -461,277 +720,197 @@ def main():
     
     # Performance settings
     st.sidebar.subheader("Performance Settings")
-    max_workers = st.sidebar.slider("Max Concurrent Requests", 5, 20, 10)
-    request_delay = st.sidebar.slider("Request Delay (seconds)", 0.05, 0.5, 0.1, 0.05)
+    max_workers = st.sidebar.slider("Max Concurrent Requests", 5, 500, 50, 5,
+                                    help="Maximum ISP requests in flight at once")
+    requests_per_second = st.sidebar.slider("Max Requests per Second", 1, 500, 10,
+                                            help="Rate limit shared by all running jobs on this server, retries included")
     timeout = st.sidebar.slider("Request Timeout (seconds)", 15, 60, 30)
+    adaptive_concurrency = st.sidebar.checkbox(
+        "Adaptive Concurrency", value=True,
+        help="Raise concurrency while latency stays flat and back off on 429/503 or latency spikes, "
+             "up to Max Concurrent Requests"
+    )
+    
+    # Cache settings
+    st.sidebar.subheader("Cache Settings")
+    use_cache = st.sidebar.checkbox("Use Response Cache", value=True,
+                                    help="Reuse ads fetched for the same keyword, country and form factor")
+    cache_ttl_hours = st.sidebar.number_input("Cache TTL (hours)", min_value=1, max_value=24 * 30, value=24)
+    cache_max_mb = st.sidebar.number_input("Max Cache Size (MB)", min_value=16, max_value=10240, value=512)
+    memory_cache = get_shared_memory_cache()
+    if st.sidebar.button("🗑️ Clear Cache"):
+        cache = create_response_cache(cache_ttl_hours, cache_max_mb)
+        cache.clear()
+        cache.close()
+        memory_cache.clear()
+        st.sidebar.success("Cache cleared")
+    memory_stats = memory_cache.stats()
+    st.sidebar.caption(
+        f"Shared memory cache: {memory_stats['entries']} keywords, "
+        f"{memory_stats['size_bytes'] / (1024 * 1024):.1f} MB, "
+        f"{memory_stats['hit_rate']*100:.0f}% hit rate"
+    )
     
     # API settings
     st.sidebar.subheader("API Settings")
     country_code = st.sidebar.selectbox("Country Code", ["FR", "UK", "US", "DE", "IT", "ES"])
     form_factor = st.sidebar.selectbox("Form Factor", ["desktop", "mobile", "tablet"])
     
+    # Resume an interrupted job
+    job_runner = get_job_runner()
+    resume_job = None
+    unfinished_jobs = [
+        job for job in list_jobs(unfinished_only=True)
+        if not job_runner.is_active(job['job_id'])
+    ]
+    if unfinished_jobs:
+        st.header("♻️ Resume Job")
+        job_labels = {
+            job['job_id']: f"{job['file_name']} · started {job['created']} · "
+                         f"{job['total_queries'] if job['total_queries'] is not None else '?'} queries"
+            for job in unfinished_jobs
+        }
+        resume_job_id = st.selectbox(
+            "Unfinished jobs",
+            [None] + list(job_labels),
+            format_func=lambda job_id: "Start a new job" if job_id is None else job_labels[job_id],
+            help="Results already saved for a job are reloaded; only the remaining keywords are dispatched"
+        )
+        if resume_job_id is not None and st.button("🗑️ Discard Job"):
+            job_runner.remove(resume_job_id)
+            delete_job(resume_job_id)
+            st.rerun()
+        if resume_job_id is not None:
+            resume_job = open_job(resume_job_id)
+            country_code = resume_job.settings['country_code']
+            form_factor = resume_job.settings['form_factor']
+            st.info(f"♻️ Resuming job {resume_job.job_id} ({country_code}, {form_factor})")
+    
     # File upload
-    st.header("📁 Upload JSON File")
+    st.header("📁 Upload Keyword File")
     uploaded_file = st.file_uploader(
-        "Choose a JSON file with search terms",
-        type=['json'],
-        help="Upload a JSON file with the structure: {'country-code': 'FR', 'form-factor': 'desktop', 'search-terms': {...}}"
+        "Choose a JSON, NDJSON or CSV file with search terms",
+        type=['json', 'ndjson', 'jsonl', 'csv'],
+        help="JSON: {'country-code': 'FR', 'form-factor': 'desktop', 'search-terms': {...}}. "
+             "NDJSON/CSV: one keyword per line with main_term, keyword, country, form_factor"
     )
     
-    if uploaded_file is not None:
+    if resume_job is not None or uploaded_file is not None:
         try:
-            # Load and validate JSON
-            input_data = json.load(uploaded_file)
-            
-            # Handle both single object and array
-            if isinstance(input_data, list):
-                data_items = input_data
+            # Read only the start of the file for a short preview; the job counts the rest
+            if resume_job is not None:
+                input_format = resume_job.settings.get('input_format', 'json')
+                input_path = resume_job.input_path
+                with open(input_path, 'rb') as input_file:
+                    input_summary = summarize_input(resume_job.job_id, input_file, input_format,
+                                                    country_code, form_factor, lambda: open(input_path, 'rb'))
             else:
-                data_items = [input_data]
+                input_format = detect_input_format(uploaded_file.name)
+                input_summary = summarize_input((uploaded_file.name, uploaded_file.size), uploaded_file,
+                                                input_format, country_code, form_factor,
+                                                lambda: io.BytesIO(uploaded_file.getbuffer()))
             
-            # Show file preview
-            st.success(f"✅ File loaded successfully! Found {len(data_items)} data item(s)")
+            # Show file preview; "+" marks counts of a file that was only partly read
+            more = '' if input_summary['complete'] else '+'
+            st.success(f"✅ File loaded successfully! Found {input_summary['data_items']}{more} data item(s)")
             
             # Display configuration summary
             col1, col2, col3 = st.columns(3)
             with col1:
-                st.metric("Data Items", len(data_items))
+                st.metric("Data Items", f"{input_summary['data_items']}{more}")
             with col2:
-                total_keywords = sum(
-                    len([k for k in variations if len(k.strip()) >= 3])
-                    for item in data_items
-                    for variations in item.get('search-terms', {}).values()
-                )
-                st.metric("Total Keywords", total_keywords)
+                total_keywords = input_summary['total_keywords']
+                st.metric("Total Keywords", f"{total_keywords}{more}")
             with col3:
-                estimated_time = total_keywords * request_delay / max_workers
-                st.metric("Est. Time", f"{estimated_time:.1f}s")
+                estimated_time = total_keywords / requests_per_second
+                st.metric("Est. Time", f"{estimated_time:.1f}s{more}")
             
-            # Show data preview
+            # Show data preview: the first few items and keywords only
             with st.expander("📋 Data Preview"):
-                for i, item in enumerate(data_items):
-                    st.write(f"**Data Item {i+1}:**")
+                for data_item, item in input_summary['preview'].items():
+                    st.write(f"**Data Item {data_item}:**")
                     st.json(item)
+                if not input_summary['complete']:
+                    st.caption("Showing the start of the file; the full counts appear once the analysis "
+                               "has read it")
             
             # Process button - only enable if VPN is working
             if vpn_status and api_status:
-                if st.button("🚀 Start Analysis", type="primary"):
-                    # Initialize session
-                    session = create_session()
-                    
-                    # Progress tracking
-                    progress_bar = st.progress(0)
-                    status_text = st.empty()
-                    
-                    summary_rows = []
-                    detailed_dict = {}
-                    processed_keywords = 0
-                    
-                    # Count total keywords
-                    total_keywords = sum(
-                        len([k for k in variations if len(k.strip()) >= 3])
-                        for item in data_items
-                        for variations in item.get('search-terms', {}).values()
-                    )
-                    
-                    # Process each data item
-                    for item_index, input_data in enumerate(data_items):
-                        st.subheader(f"📋 Processing Data Item {item_index + 1}/{len(data_items)}")
-                        
-                        item_country = input_data.get('country-code', country_code)
-                        item_form_factor = input_data.get('form-factor', form_factor)
-                        search_terms = input_data.get('search-terms', {})
-                        
-                        if not search_terms:
-                            st.warning("No search terms found in this item, skipping...")
-                            continue
-                        
-                        # Process each search term
-                        for main_term, keyword_variations in search_terms.items():
-                            st.write(f"🔍 **{main_term}** ({len(keyword_variations)} variations)")
-                            
-                            # Filter valid keywords
-                            valid_keywords = [k.strip() for k in keyword_variations if len(k.strip()) >= 3]
-                            
-                            if not valid_keywords:
-                                st.warning("No valid keywords found, skipping...")
-                                continue
-                            
-                            # Process in batches
-                            batch_size = 20
-                            for i in range(0, len(valid_keywords), batch_size):
-                                batch = valid_keywords[i:i + batch_size]
-                                st.write(f"📦 Processing batch {i//batch_size + 1}/{(len(valid_keywords) + batch_size - 1)//batch_size}")
-                                
-                                # Process batch
-                                batch_results = process_keyword_batch(
-                                    batch, item_country, item_form_factor, session, 
-                                    progress_bar, status_text
-                                )
-                                
-                                # Process results
-                                for keyword, ads in batch_results.items():
-                                    advertiser_names = []
-                                    details = []
-                                    
-                                    for ad in ads:
-                                        name = ad.get('adv_name', '').strip()
-                                        score = ad.get('keywordMatchingResult', {}).get('relevanceScore', '')
-                                        if name:
-                                            advertiser_names.append(name)
-                                            details.append({
-                                                "advertiser_name": name,
-                                                "relevance_score": score
-                                            })
-                                    
-                                    summary_rows.append({
-                                        "data_item": item_index + 1,
-                                        "main_term": main_term,
-                                        "qt": keyword,
-                                        "advertisers": ",".join(advertiser_names),
-                                        "ad_count": len(ads)
-                                    })
-                                    
-                                    detailed_dict[keyword] = {
-                                        "data_item": item_index + 1,
-                                        "main_term": main_term,
-                                        "details": details
-                                    }
-                                    
-                                    processed_keywords += 1
-                                    
-                                    # Update overall progress
-                                    overall_progress = processed_keywords / total_keywords
-                                    progress_bar.progress(overall_progress)
-                                    status_text.text(f"📊 Progress: {processed_keywords}/{total_keywords} ({overall_progress*100:.1f}%)")
-                    
-                    session.close()
-                    
-                    # Results section
-                    st.success("✅ Analysis completed!")
-                    
-                    # Create DataFrame
-                    df = pd.DataFrame(summary_rows)
-                    
-                    # Display results
-                    st.header("📊 Results")
-                    
-                    # Metrics
-                    col1, col2, col3, col4 = st.columns(4)
-                    with col1:
-                        st.metric("Total Keywords", len(df))
-                    with col2:
-                        st.metric("Keywords with Ads", len(df[df['ad_count'] > 0]))
-                    with col3:
-                        st.metric("Total Ads Found", df['ad_count'].sum())
-                    with col4:
-                        st.metric("Unique Advertisers", len(set(
-                            advertiser for advertisers in df['advertisers'] 
-                            if advertisers for advertiser in advertisers.split(',')
-                        )))
-                    
-                    # Results table
-                    st.subheader("📋 Results Table")
-                    st.dataframe(df, use_container_width=True)
-                    
-                    # Charts
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        # Advertiser distribution
-                        if not df.empty:
-                            advertiser_counts = {}
-                            for advertisers in df['advertisers']:
-                                if advertisers:
-                                    for advertiser in advertisers.split(','):
-                                        advertiser = advertiser.strip()
-                                        advertiser_counts[advertiser] = advertiser_counts.get(advertiser, 0) + 1
-                            
-                            if advertiser_counts:
-                                advertiser_df = pd.DataFrame(list(advertiser_counts.items()), 
-                                                           columns=['Advertiser', 'Count'])
-                                advertiser_df = advertiser_df.sort_values('Count', ascending=False).head(10)
-                                
-                                fig = px.bar(advertiser_df, x='Advertiser', y='Count', 
-                                            title="Top 10 Advertisers")
-                                st.plotly_chart(fig, use_container_width=True)
-                    
-                    with col2:
-                        # Ads per keyword distribution
-                        if not df.empty:
-                            fig = px.histogram(df, x='ad_count', nbins=20, 
-                                             title="Distribution of Ads per Keyword")
-                            st.plotly_chart(fig, use_container_width=True)
-                    
-                    # Export options
-                    st.header("💾 Export Results")
-                    
-                    col1, col2, col3 = st.columns(3)
-                    
-                    with col1:
-                        # CSV export
-                        csv = df.to_csv(index=False)
-                        st.download_button(
-                            label="📄 Download CSV",
-                            data=csv,
-                            file_name="keyword_analysis_results.csv",
-                            mime="text/csv"
+                start_label = "▶️ Resume Analysis" if resume_job is not None else "🚀 Start Analysis"
+                if st.button(start_label, type="primary"):
+                    # Journal every result so the run can be resumed if interrupted
+                    if resume_job is not None:
+                        journal = resume_job
+                    else:
+                        # Old finished jobs go first; the ones this server still shows are kept
+                        prune_jobs(keep=[retained.job_id for retained in job_runner.jobs()])
+                        journal = create_job(
+                            uploaded_file, uploaded_file.name,
+                            {'country_code': country_code, 'form_factor': form_factor, 'input_format': input_format},
                         )
                     
-                    with col2:
-                        # JSON export
-                        json_str = json.dumps(detailed_dict, ensure_ascii=False, indent=2)
-                        st.download_button(
-                            label="📄 Download JSON",
-                            data=json_str,
-                            file_name="keyword_analysis_detailed.json",
-                            mime="application/json"
-                        )
+                    # Parallel jobs draw from one bucket, so together they never exceed
+                    # the rate; the latest job's setting applies to all of them
+                    rate_limiter = get_rate_limiter()
+                    rate_limiter.set_rate(requests_per_second)
                     
-                    with col3:
-                        # Excel export
-                        output = io.BytesIO()
-                        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                            df.to_excel(writer, sheet_name='Summary', index=False)
-                            
-                            # Create detailed sheet
-                            detailed_rows = []
-                            for keyword, data in detailed_dict.items():
-                                for detail in data['details']:
-                                    detailed_rows.append({
-                                        'keyword': keyword,
-                                        'main_term': data['main_term'],
-                                        'data_item': data['data_item'],
-                                        'advertiser': detail['advertiser_name'],
-                                        'relevance_score': detail['relevance_score']
-                                    })
-                            
-                            if detailed_rows:
-                                detailed_df = pd.DataFrame(detailed_rows)
-                                detailed_df.to_excel(writer, sheet_name='Detailed', index=False)
-                        
-                        excel_data = output.getvalue()
-                        st.download_button(
-                            label="📄 Download Excel",
-                            data=excel_data,
-                            file_name="keyword_analysis_results.xlsx",
-                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                        )
+                    # Hand the run to the server's background runner so reruns can't kill it;
+                    # it reads keywords from the journal's copy of the input as it dispatches
+                    job = AnalysisJob(
+                        journal,
+                        engine_options={
+                            'max_concurrency': max_workers,
+                            'timeout': timeout,
+                            'rate_limiter': rate_limiter,
+                            'adaptive': adaptive_concurrency,
+                            'memory_cache': memory_cache if use_cache else None,
+                            'single_flight': get_single_flight(),
+                        },
+                        cache_options={'ttl_hours': cache_ttl_hours, 'max_size_mb': cache_max_mb} if use_cache else None,
+                    )
+                    st.session_state['job_id'] = job_runner.submit(job)
             else:
                 st.warning("⚠️ Please ensure VPN connection is working before starting analysis")
                 
-        except json.JSONDecodeError as e:
-            st.error(f"❌ Invalid JSON file: {e}")
+        except InvalidInputError as e:
+            st.error(f"❌ Invalid input file: {e}")
         except Exception as e:
             st.error(f"❌ Error processing file: {e}")
     
+    # Background jobs: progress for running ones, results for finished ones
+    job = None
+    retained_jobs = job_runner.jobs()
+    if retained_jobs:
+        st.header("🗂️ Analysis Jobs")
+        job_ids = [retained.job_id for retained in retained_jobs]
+        current_job_id = st.session_state.get('job_id')
+        selected_job_id = st.selectbox(
+            "Job",
+            job_ids,
+            index=job_ids.index(current_job_id) if current_job_id in job_ids else 0,
+            format_func=lambda job_id: f"{job_id} · {job_runner.get(job_id).file_name} · {job_runner.get(job_id).status}",
+            help="Jobs keep running on the server if you refresh or close the page"
+        )
+        st.session_state['job_id'] = selected_job_id
+        job = job_runner.get(selected_job_id)
+        if job.active:
+            if st.button("⏹️ Cancel Job"):
+                job.cancel()
+            render_active_job(job)
+        else:
+            if st.button("🗑️ Delete Job", help="Remove the job with its saved input, results and exports"):
+                job_runner.remove(selected_job_id)
+                delete_job(selected_job_id)
+                st.rerun()
+            render_results(job)
+    
     # Instructions
     with st.sidebar:
         st.header("📖 Instructions")
         st.markdown("""
         1. **Connect to VPN** - Ensure you're connected to your company VPN
         2. **Check Status** - Verify VPN and API connectivity above
-        3. **Upload JSON file** with search terms
+        3. **Upload a JSON, NDJSON or CSV file** with search terms
         4. **Configure settings** in sidebar
         5. **Click Start Analysis** to begin
         6. **View results** and download exports
@@ -747,11 +926,22 @@ def main():
         }
         ```
         
+        **NDJSON / CSV Format:** one keyword per line
+        ```
+        main_term,keyword,country,form_factor
+        main term,keyword1,FR,desktop
+        ```
+        
         **VPN Requirements:**
         - Must be connected to company VPN
         - Contact IT if you need VPN credentials
         - Refresh page after connecting to VPN
         """)
+    
+    # Without fragments, poll the running job by rerunning the whole page
+    if fragment is None and job is not None and job.active:
+        time.sleep(1)
+        st.rerun()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -294,6 +294,16 @@ class VPNManager:
         
         return info
     
+    def collect_status(self) -> Dict:
+        """VPN connections with their detailed status, plus network info, in one pass"""
+        connections = self.list_vpn_connections()
+        for conn in connections:
+            conn['status_message'] = self.get_vpn_status(conn['name'])[1]
+        return {
+            'connections': connections,
+            'network_info': self.get_network_info()
+        }
+    
     def test_internal_connectivity(self) -> Dict:
         """Test connectivity to internal resources"""
         tests = {